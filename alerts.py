@@ -0,0 +1,223 @@
+"""
+Threshold Alerts
+
+Rules watch one value of the system monitor's samples (cpu_percent,
+memory_percent, disk_percent, disk_write_rate, ...) and fire when its
+average over a rolling window crosses a threshold:
+
+    AlertEngine([AlertRule('CPU high', 'cpu_percent', 90, window=300)],
+                sinks=[LogFileSink(), WebhookSink('http://localhost:8080/alerts')]).attach(sampler)
+
+Each sample costs every rule O(1): a running sum over a deque of the
+window's samples. A firing rule resolves only once the average falls
+past its clear threshold (hysteresis), and fires again no sooner than
+its cooldown, so a value hovering around the threshold does not flap.
+
+Sinks are any callables taking an alert dict; they run on their own
+thread so a slow webhook never delays sampling.
+"""
+import json
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import urllib.request
+from collections import deque
+from datetime import datetime
+
+from events import emit
+
+# Seconds a threshold must be crossed on average before a rule fires
+DEFAULT_ALERT_WINDOW = 300
+# Least seconds between two firings of the same rule
+DEFAULT_COOLDOWN = 900
+# Share of the threshold the average must fall back past before a rule resolves
+DEFAULT_HYSTERESIS = 0.1
+# File LogFileSink appends alerts to
+ALERT_LOG_FILE = "alerts.log"
+# Seconds a webhook or notification command may take
+SINK_TIMEOUT = 5
+
+class AlertRule:
+    """Fires when the rolling average of one sample value crosses threshold.
+
+    The rule needs a full window of samples before it can fire. With
+    below=True it fires when the average drops under threshold instead,
+    e.g. for free space. clear_threshold defaults to DEFAULT_HYSTERESIS
+    of the threshold on the safe side of it.
+    """
+
+    def __init__(self, name, metric, threshold, window=DEFAULT_ALERT_WINDOW, clear_threshold=None,
+                 cooldown=DEFAULT_COOLDOWN, below=False):
+        self.name = name
+        self.metric = metric
+        self.threshold = threshold
+        self.window = window
+        self.below = below
+        if clear_threshold is None:
+            margin = abs(threshold) * DEFAULT_HYSTERESIS
+            clear_threshold = threshold + margin if below else threshold - margin
+        self.clear_threshold = clear_threshold
+        self.cooldown = cooldown
+        self.firing = False
+        self._samples = deque()
+        self._sum = 0.0
+        self._first = None
+        self._last_fired = None
+
+    def update(self, timestamp, value):
+        """Add a sample; returns an alert dict when the rule fires or resolves"""
+        samples = self._samples
+        samples.append((timestamp, value))
+        self._sum += value
+        cutoff = timestamp - self.window
+        while samples[0][0] <= cutoff:
+            self._sum -= samples.popleft()[1]
+        if self._first is None:
+            self._first = timestamp
+        average = self._sum / len(samples)
+
+        if self.firing:
+            cleared = average > self.clear_threshold if self.below else average < self.clear_threshold
+            if cleared:
+                self.firing = False
+                return self._alert('resolved', timestamp, average)
+            return None
+        if timestamp - self._first < self.window:
+            return None
+        crossed = average < self.threshold if self.below else average > self.threshold
+        if crossed and (self._last_fired is None or timestamp - self._last_fired >= self.cooldown):
+            self.firing = True
+            self._last_fired = timestamp
+            return self._alert('firing', timestamp, average)
+        return None
+
+    def _alert(self, state, timestamp, average):
+        direction = 'below' if self.below else 'above'
+        if state == 'firing':
+            message = (f"🚨 {self.name}: {self.metric} averaged {average:.1f} over {self.window:g} s, "
+                       f"{direction} {self.threshold:g}")
+        else:
+            message = f"✅ {self.name} resolved: {self.metric} averaged {average:.1f} over {self.window:g} s"
+        return {
+            'rule': self.name,
+            'metric': self.metric,
+            'state': state,
+            'value': average,
+            'threshold': self.threshold,
+            'timestamp': timestamp,
+            'message': message,
+        }
+
+def default_rules():
+    """Sustained high CPU, memory and system disk usage"""
+    return [
+        AlertRule('CPU high', 'cpu_percent', 90, window=300),
+        AlertRule('Memory high', 'memory_percent', 90, window=300),
+        AlertRule('Disk almost full', 'disk_percent', 90, window=60),
+    ]
+
+def emit_alert(alert):
+    """Sink reporting alerts like any other output (printed without a listener)"""
+    emit(alert['message'], kind='warning' if alert['state'] == 'firing' else 'message', alert=alert)
+
+class LogFileSink:
+    """Appends one line per alert to a log file"""
+
+    def __init__(self, path=ALERT_LOG_FILE):
+        self.path = path
+
+    def __call__(self, alert):
+        when = datetime.fromtimestamp(alert['timestamp']).isoformat(timespec='seconds')
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"{when} {alert['state'].upper()} {alert['message']}\n")
+
+class WebhookSink:
+    """POSTs each alert as JSON to a URL"""
+
+    def __init__(self, url, timeout=SINK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, alert):
+        request = urllib.request.Request(self.url, data=json.dumps(alert).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+class DesktopNotificationSink:
+    """Shows alerts as desktop notifications (notify-send on Linux, osascript on macOS).
+
+    Where neither is available the alert is emitted as a warning instead.
+    """
+
+    def __init__(self, title="System alert"):
+        self.title = title
+
+    def _command(self, message):
+        if sys.platform == 'darwin' and shutil.which('osascript'):
+            return ['osascript', '-e',
+                    f'display notification {json.dumps(message)} with title {json.dumps(self.title)}']
+        if shutil.which('notify-send'):
+            return ['notify-send', self.title, message]
+        return None
+
+    def __call__(self, alert):
+        command = self._command(alert['message'])
+        if command is None:
+            emit_alert(alert)
+            return
+        subprocess.run(command, timeout=SINK_TIMEOUT, check=False, capture_output=True)
+
+class AlertEngine:
+    """Evaluates rules against every sample and hands alerts to the sinks.
+
+    attach(sampler) registers evaluate() as a SystemSampler listener.
+    Sinks are called one alert at a time on a dispatcher thread; a sink
+    that raises is reported and the others still run.
+    """
+
+    def __init__(self, rules=None, sinks=(emit_alert,)):
+        self.rules = default_rules() if rules is None else list(rules)
+        self.sinks = list(sinks)
+        self._queue = queue.SimpleQueue()
+        self._dispatcher = None
+        self._lock = threading.Lock()
+
+    def attach(self, sampler):
+        sampler.add_listener(self.evaluate)
+        return self
+
+    def evaluate(self, stats):
+        """Update every rule with a sample; returns the alerts it raised"""
+        alerts = []
+        for rule in self.rules:
+            value = stats.get(rule.metric)
+            if value is None:
+                continue
+            alert = rule.update(stats['timestamp'], value)
+            if alert is not None:
+                alerts.append(alert)
+                self._dispatch(alert)
+        return alerts
+
+    def firing(self):
+        return [rule for rule in self.rules if rule.firing]
+
+    def _dispatch(self, alert):
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._deliver, name='alert-sinks', daemon=True)
+                self._dispatcher.start()
+        self._queue.put(alert)
+
+    def _deliver(self):
+        while True:
+            alert = self._queue.get()
+            for sink in self.sinks:
+                try:
+                    sink(alert)
+                except Exception as e:
+                    emit(f"❌ Alert sink {getattr(sink, '__name__', type(sink).__name__)} failed: {e}",
+                         kind='error')
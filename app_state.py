@@ -0,0 +1,61 @@
+"""
+Application State Files
+
+The rename journal, the organizer's snapshot index and the file caches
+live in one per-user state directory instead of the current directory,
+so organizing or renaming the folder the suite runs from never touches
+its own state. Set AUTOMATION_SUITE_STATE_DIR to put them elsewhere.
+"""
+import os
+import sys
+
+# Environment variable overriding the state directory
+STATE_DIR_ENV = 'AUTOMATION_SUITE_STATE_DIR'
+# Name of the suite's folder inside the platform's state directory
+APP_NAME = 'python-automation-suite'
+# Files SQLite keeps next to a database while it is open
+SQLITE_SIDECARS = ('-wal', '-shm', '-journal')
+
+# Every path handed out by state_path(), for scans to skip
+_state_files = set()
+
+def state_dir():
+    """The per-user directory state files are kept in"""
+    if os.environ.get(STATE_DIR_ENV):
+        return os.path.abspath(os.environ[STATE_DIR_ENV])
+    home = os.path.expanduser('~')
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(home, 'AppData', 'Local')
+    elif sys.platform == 'darwin':
+        base = os.path.join(home, 'Library', 'Application Support')
+    else:
+        base = os.environ.get('XDG_STATE_HOME') or os.path.join(home, '.local', 'state')
+    return os.path.join(base, APP_NAME)
+
+def state_path(name):
+    """Absolute path of a state file (the directory is created by prepare())"""
+    path = os.path.join(state_dir(), name)
+    _state_files.add(path)
+    return path
+
+def prepare(path):
+    """Create the folder a state file goes in; returns the path"""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    return path
+
+def state_names_by_dir(paths=()):
+    """{folder: {file names}} of state files and their SQLite sidecars, for scans to skip.
+
+    Covers every path from state_path() plus the given ones.
+    """
+    names = {}
+    for path in _state_files.union(path for path in paths if path):
+        path = os.path.normcase(os.path.abspath(path))
+        folder, name = os.path.split(path)
+        names.setdefault(folder, set()).update([name] + [name + suffix for suffix in SQLITE_SIDECARS])
+    return names
+
+def skipped_names(directory, names_by_dir):
+    """The names in directory that are state files, from state_names_by_dir()"""
+    return names_by_dir.get(os.path.normcase(os.path.abspath(directory)), ())
@@ -2,202 +2,871 @@
 Batch File Renamer with Undo Support
 """
 import os
+import re
 import json
+import sqlite3
+import threading
+import time
 from datetime import datetime
 
-# Global variable to store rename history
-rename_history = []
+import app_state
+import events
+from events import emit
+from move_plan import PlanBuilder
+from rename_templates import RenameTemplate, prefix_template
+
+# Append-only journal of rename sessions (SQLite in WAL mode), in the per-user state folder
+RENAME_HISTORY_DB = app_state.state_path('rename_history.db')
+# History file earlier versions wrote to the current folder; imported into the journal once
+LEGACY_HISTORY_FILE = os.path.abspath('rename_history.json')
+# Prefix of the temporary names used to break rename cycles
+TEMP_PREFIX = '.~rename-tmp-'
+# Sessions shown per page of rename history
+HISTORY_PAGE_SIZE = 20
+# Orders batch_rename can number files in ('none' keeps directory order)
+SORT_ORDERS = ('natural', 'name', 'mtime', 'size', 'ext', 'none')
+
+_DIGITS = re.compile(r'\d+')
+
+class RenameJournal:
+    """Rename history stored as an append-only SQLite journal.
+
+    Each session is one row, keyed by an increasing id, with its operations
+    in a separate table, so recording a session appends a few rows and one
+    commit instead of rewriting the whole history. The database runs in WAL
+    mode with synchronous=FULL, so every commit is an fsync point and a
+    crash never leaves a half-written session.
+
+    Nothing is opened until the history is first used. The object behaves
+    like the list of session dicts it replaces: len(), indexing (oldest
+    first, negative indexes allowed), iteration, append() and pop().
+
+    A session can also be written ahead of the renames with begin(): it
+    stays 'pending', hidden from the history, with the inode of every file
+    it is about to rename, until retain() keeps the operations that really
+    happened. A pending session left behind by a crash is how an
+    interrupted run is found and recovered.
+    """
+
+    def __init__(self, path=RENAME_HISTORY_DB):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(app_state.prepare(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                               "id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, "
+                               "directory TEXT, prefix TEXT, count INTEGER, "
+                               "state TEXT NOT NULL DEFAULT 'committed')")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS operations ("
+                               "session_id INTEGER, seq INTEGER, old_name TEXT, new_name TEXT, "
+                               "inode INTEGER, PRIMARY KEY (session_id, seq)) WITHOUT ROWID")
+            # Journals written before intent records existed lack the new columns
+            for table, column, definition in (
+                    ('sessions', 'state', "TEXT NOT NULL DEFAULT 'committed'"),
+                    ('operations', 'inode', 'INTEGER')):
+                columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            # Indexes behind the history queries: newest-first pages and filters
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_by_state ON sessions (state, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_by_timestamp ON sessions (timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_by_directory ON sessions (directory)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_by_prefix ON sessions (prefix)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS operations_by_old_name "
+                               "ON operations (old_name, session_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS operations_by_new_name "
+                               "ON operations (new_name, session_id)")
+            self._conn.commit()
+            self._import_legacy_history()
+        return self._conn
+
+    def _import_legacy_history(self):
+        """Move sessions from an old rename_history.json into the journal"""
+        if not os.path.exists(LEGACY_HISTORY_FILE):
+            return
+        try:
+            with open(LEGACY_HISTORY_FILE, 'r') as f:
+                sessions = json.load(f)
+            for session in sessions:
+                self._insert(session)
+            self._conn.commit()
+            os.replace(LEGACY_HISTORY_FILE, LEGACY_HISTORY_FILE + '.migrated')
+        except Exception as e:
+            self._conn.rollback()
+            emit(f"Warning: Could not import {LEGACY_HISTORY_FILE}: {e}", kind='warning')
+
+    def _insert(self, session, state='committed'):
+        cursor = self._conn.execute(
+            "INSERT INTO sessions (timestamp, directory, prefix, count, state) VALUES (?, ?, ?, ?, ?)",
+            (session['timestamp'], session['directory'], session['prefix'],
+             len(session['operations']), state))
+        session_id = cursor.lastrowid
+        self._conn.executemany(
+            "INSERT INTO operations VALUES (?, ?, ?, ?, ?)",
+            ((session_id, seq, op['old_name'], op['new_name'], op.get('inode'))
+             for seq, op in enumerate(session['operations'])))
+        return session_id
+
+    def _session_id(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("rename session index out of range")
+        return self._connect().execute("SELECT id FROM sessions WHERE state = 'committed' "
+                                       "ORDER BY id LIMIT 1 OFFSET ?", (index,)).fetchone()[0]
+
+    def _load_session(self, session_id, with_inodes=False):
+        conn = self._connect()
+        timestamp, directory, prefix, _ = conn.execute(
+            "SELECT timestamp, directory, prefix, count FROM sessions WHERE id = ?",
+            (session_id,)).fetchone()
+        operations = [{'seq': seq, 'old_name': old_name, 'new_name': new_name}
+                      for seq, old_name, new_name in conn.execute(
+                          "SELECT seq, old_name, new_name FROM operations "
+                          "WHERE session_id = ? ORDER BY seq", (session_id,))]
+        if with_inodes:
+            inodes = conn.execute("SELECT inode FROM operations WHERE session_id = ? ORDER BY seq",
+                                  (session_id,))
+            for operation, (inode,) in zip(operations, inodes):
+                operation['inode'] = inode
+        return {'id': session_id, 'timestamp': timestamp, 'directory': directory,
+                'prefix': prefix, 'operations': operations}
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM sessions WHERE state = 'committed'").fetchone()[0]
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        with self._lock:
+            return self._load_session(self._session_id(index))
+
+    def __iter__(self):
+        for session_id in self._ids("state = 'committed' ORDER BY id"):
+            yield self._load_session(session_id)
+
+    def __reversed__(self):
+        for session_id in self._ids("state = 'committed' ORDER BY id DESC"):
+            yield self._load_session(session_id)
+
+    def _ids(self, where):
+        with self._lock:
+            return [row[0] for row in self._connect().execute(f"SELECT id FROM sessions WHERE {where}")]
+
+    def summaries(self):
+        """Session dicts with an operation 'count' but without the operations"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, timestamp, directory, prefix, count FROM sessions "
+                "WHERE state = 'committed' ORDER BY id").fetchall()
+        return [{'id': row[0], 'timestamp': row[1], 'directory': row[2], 'prefix': row[3],
+                 'count': row[4]} for row in rows]
+
+    @staticmethod
+    def _filters(directory=None, prefix=None, filename=None, since=None, until=None):
+        """WHERE clause and parameters selecting committed sessions"""
+        clauses = ["state = 'committed'"]
+        params = []
+        if directory is not None:
+            clauses.append("directory = ?")
+            params.append(directory)
+        if prefix is not None:
+            clauses.append("prefix = ?")
+            params.append(prefix)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if filename is not None:
+            clauses.append("id IN (SELECT session_id FROM operations WHERE old_name = ? "
+                           "UNION SELECT session_id FROM operations WHERE new_name = ?)")
+            params.extend((filename, filename))
+        return " AND ".join(clauses), params
+
+    def query(self, offset=0, limit=HISTORY_PAGE_SIZE, **filters):
+        """One page of session summaries, newest first.
+
+        Filters: directory, prefix, filename (matches a file's old or new
+        name), since and until (ISO timestamps). Each summary also carries
+        its 'index' for undo_rename_session.
+        """
+        where, params = self._filters(**filters)
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                f"SELECT id, timestamp, directory, prefix, count FROM sessions WHERE {where} "
+                "ORDER BY id DESC LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+            if not rows:
+                return []
+            # Positions for the whole page from one count below it and one range scan
+            lowest, highest = rows[-1][0], rows[0][0]
+            position = conn.execute("SELECT COUNT(*) FROM sessions WHERE state = 'committed' AND id < ?",
+                                    (lowest,)).fetchone()[0]
+            indexes = {session_id: position + i for i, (session_id,) in enumerate(conn.execute(
+                "SELECT id FROM sessions WHERE state = 'committed' AND id BETWEEN ? AND ? ORDER BY id",
+                (lowest, highest)))}
+        return [{'id': row[0], 'timestamp': row[1], 'directory': row[2], 'prefix': row[3],
+                 'count': row[4], 'index': indexes[row[0]]} for row in rows]
+
+    def count(self, **filters):
+        """Number of sessions matching the query filters"""
+        where, params = self._filters(**filters)
+        with self._lock:
+            return self._connect().execute(f"SELECT COUNT(*) FROM sessions WHERE {where}",
+                                           params).fetchone()[0]
+
+    def get(self, session_id):
+        """The committed session with this id, or None if it is gone"""
+        with self._lock:
+            row = self._connect().execute("SELECT 1 FROM sessions WHERE id = ? AND state = 'committed'",
+                                          (session_id,)).fetchone()
+            return self._load_session(session_id) if row is not None else None
+
+    def index_of(self, session_id):
+        """Position of a session in the history (oldest first)"""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*) FROM sessions WHERE state = 'committed' AND id < ?",
+                (session_id,)).fetchone()[0]
+
+    def append(self, session):
+        """Record a session; it is on disk once this returns"""
+        with self._lock:
+            self._connect()
+            try:
+                session_id = self._insert(session)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return session_id
+
+    def begin(self, session):
+        """Write a session's intended operations (with inodes) before renaming.
+
+        The session stays pending, and out of the history, until retain().
+        """
+        with self._lock:
+            self._connect()
+            try:
+                session_id = self._insert(session, state='pending')
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            return session_id
+
+    def retain(self, session_id, completed):
+        """Keep only the operations at the given seq numbers and commit the session.
+
+        Used both to record what a run really renamed and to trim a session
+        down to what a partial undo could not restore; a session left with
+        no operations is dropped altogether.
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS completed (seq INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM completed")
+                conn.executemany("INSERT INTO completed VALUES (?)", ((seq,) for seq in completed))
+                conn.execute("DELETE FROM operations WHERE session_id = ? "
+                             "AND seq NOT IN (SELECT seq FROM completed)", (session_id,))
+                conn.execute("DELETE FROM completed")
+                if completed:
+                    conn.execute("UPDATE sessions SET count = ?, state = 'committed' WHERE id = ?",
+                                 (len(completed), session_id))
+                else:
+                    conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def pending(self):
+        """Sessions begun but never finished, with their operations and inodes"""
+        with self._lock:
+            return [self._load_session(session_id, with_inodes=True)
+                    for session_id in self._ids("state = 'pending' ORDER BY id")]
+
+    def pop(self, index=-1):
+        with self._lock:
+            session_id = self._session_id(index)
+            session = self._load_session(session_id)
+            self._conn.execute("DELETE FROM operations WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+            return session
+
+    def clear(self):
+        with self._lock:
+            self.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Global rename history; the journal is only opened when first used
+rename_history = RenameJournal()
 
 def save_rename_history():
-    """Save rename history to a JSON file"""
-    try:
-        with open('rename_history.json', 'w') as f:
-            json.dump(rename_history, f, indent=2)
-    except Exception as e:
-        print(f"Warning: Could not save rename history: {e}")
+    """Kept for compatibility: the journal is written as each session is recorded"""
 
 def load_rename_history():
-    """Load rename history from JSON file"""
-    global rename_history
+    """Drop the open journal connection so the next access re-reads it from disk"""
     try:
-        if os.path.exists('rename_history.json'):
-            with open('rename_history.json', 'r') as f:
-                rename_history = json.load(f)
+        rename_history.close()
     except Exception as e:
-        print(f"Warning: Could not load rename history: {e}")
-        rename_history = []
+        emit(f"Warning: Could not load rename history: {e}", kind='warning')
+
+def _temp_name(taken):
+    """Pick a temporary name that is not in use"""
+    counter = 0
+    while f"{TEMP_PREFIX}{counter}" in taken:
+        counter += 1
+    name = f"{TEMP_PREFIX}{counter}"
+    taken.add(name)
+    return name
+
+def valid_file_name(name):
+    """True if name is a single path component a file can be renamed to"""
+    if name in ('', '.', '..') or '\0' in name:
+        return False
+    return os.sep not in name and not (os.altsep and os.altsep in name)
+
+def order_renames(renames, occupied, fold=None):
+    """Order a set of renames inside one directory so nothing is overwritten.
+
+    renames maps old name -> new name; occupied holds the names in the
+    directory that are not being renamed. A rename may target a name that
+    another renamed file is leaving: such renames form chains, run from the
+    free end backwards, and cycles (a -> b -> a) are broken with a single
+    temporary name each, the fewest possible.
+
+    fold maps a name to the form the file system compares names in (e.g.
+    str.casefold on a case-insensitive one), so a.txt and A.txt count as
+    the same name there.
+
+    Returns (chains, conflicts). chains is a list of lists of (old, new)
+    steps, each list to be run in order; chains are independent of each
+    other. conflicts lists the renames that cannot happen because their
+    target is held by something that stays (a file keeping its name
+    included), is claimed twice, or is not a plain file name.
+    """
+    fold = fold or (lambda name: name)
+    moves = {}
+    wants = {}  # folded new name -> old name of the file that will take it
+    conflicts = []
+    # Files whose new name is their current one stay put and keep that name
+    occupied = {fold(name) for name in occupied}
+    occupied.update(fold(old) for old, new in renames.items() if old == new)
+    for old, new in renames.items():
+        if old == new:
+            continue
+        if fold(new) in wants or not valid_file_name(new):
+            conflicts.append((old, new))
+            continue
+        moves[old] = new
+        wants[fold(new)] = old
+    leaving = {fold(old): old for old in moves}  # folded name -> file giving it up
 
-def batch_rename(directory, prefix):
+    # A blocked file stays put, which in turn blocks whoever wanted its name
+    blocked = [old for old, new in moves.items() if fold(new) in occupied]
+    blocked.extend(old for old, _ in conflicts)
+    while blocked:
+        old = blocked.pop()
+        new = moves.pop(old, None)
+        if new is not None:
+            conflicts.append((old, new))
+            del wants[fold(new)]
+        waiting = wants.get(fold(old))
+        if waiting in moves:
+            blocked.append(waiting)
+
+    chains = []
+    for head in [old for old, new in moves.items() if leaving.get(fold(new)) not in moves]:
+        chain = []
+        current = head
+        while current in moves:
+            chain.append((current, moves.pop(current)))
+            current = wants.get(fold(current))
+        chains.append(chain)
+
+    # Whatever is left forms cycles (a change of case alone is one of its own)
+    taken = occupied | {fold(name) for name in renames} | set(wants)
+    while moves:
+        start, start_target = next(iter(moves.items()))
+        temp = _temp_name(taken)
+        chain = [(start, temp)]
+        del moves[start]
+        current = wants[fold(start)]
+        while current != start:
+            chain.append((current, moves.pop(current)))
+            current = wants[fold(current)]
+        chain.append((temp, start_target))
+        chains.append(chain)
+    return chains, conflicts
+
+def _case_insensitive(directory, names):
+    """True if the file system holding directory ignores case in names.
+
+    Looks a name up with its case swapped; folders with no cased names
+    fall back to the platform's convention.
+    """
+    for name in names:
+        swapped = name.swapcase()
+        if swapped != name:
+            try:
+                return os.path.samefile(os.path.join(directory, name), os.path.join(directory, swapped))
+            except OSError:
+                return False
+    return os.path.normcase('A') == os.path.normcase('a')
+
+def _number_key(match):
+    digits = match.group().lstrip('0') or '0'
+    # Length first, so longer numbers sort after shorter ones
+    return chr(len(digits)) + digits
+
+def natural_key(name):
+    """Sort key putting file2 before file10, ignoring case.
+
+    Numbers are rewritten in place as length + digits, so the key is a
+    plain string and a million keys sort at C speed.
+    """
+    return _DIGITS.sub(_number_key, name.casefold()), name
+
+def _sort_key(sort, name, stat_result):
+    """Sort key of a file for one of SORT_ORDERS other than 'none'"""
+    if sort == 'natural':
+        return natural_key(name)
+    if sort == 'name':
+        return name
+    if sort == 'mtime':
+        return stat_result.st_mtime_ns, natural_key(name)
+    if sort == 'size':
+        return stat_result.st_size, natural_key(name)
+    return os.path.splitext(name)[1].casefold(), natural_key(name)
+
+def _scan_directory(directory, with_mtimes=False, sort='none', reverse=False):
+    """Files in a directory (name -> inode, in the given order) and its other entry names.
+
+    Sort keys are computed during the one scandir pass, from the stat
+    result scandir already holds, so ordering never stats a file twice.
+    With with_mtimes, also returns each file's modification time. The
+    rename journal and its SQLite sidecars are never listed, should the
+    state folder be the one being renamed.
+    """
+    if sort not in SORT_ORDERS:
+        raise ValueError(f"unknown sort order {sort!r}; choose from {', '.join(SORT_ORDERS)}")
+    needs_stat = with_mtimes or sort in ('mtime', 'size')
+    keyed = []
+    others = set()
+    mtimes = {} if with_mtimes else None
+    state_files = app_state.skipped_names(
+        directory, app_state.state_names_by_dir([rename_history.path, LEGACY_HISTORY_FILE]))
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if state_files and os.path.normcase(entry.name) in state_files:
+                continue
+            if not entry.is_file():
+                others.add(entry.name)
+                continue
+            stat_result = entry.stat() if needs_stat else None
+            if with_mtimes:
+                mtimes[entry.name] = stat_result.st_mtime
+            key = _sort_key(sort, entry.name, stat_result) if sort != 'none' else None
+            keyed.append((key, entry.name, entry.inode()))
+    if sort != 'none':
+        keyed.sort(key=lambda item: item[0], reverse=reverse)
+    elif reverse:
+        keyed.reverse()
+    files = {name: inode for _, name, inode in keyed}
+    return files, others, mtimes
+
+def _new_names(directory, prefix, template=None, pattern=None, sort='natural', reverse=False):
+    """Scan a directory and work out the new name of every file to rename.
+
+    Returns the files (name -> inode), the names that stay put and the renames.
+    """
+    if template:
+        compiled = RenameTemplate(template, pattern)
+    else:
+        compiled = prefix_template(prefix, pattern)
+    files, others, mtimes = _scan_directory(directory, compiled.uses_mtime, sort, reverse)
+    renames = compiled.apply(list(files), mtimes)
+    # Files the pattern leaves out keep their names, so their names are taken
+    others.update(name for name in files if name not in renames)
+    return files, others, renames
+
+def _build_rename_plan(directory, renames, occupied):
+    """Order renames inside a directory and turn them into a MovePlan"""
+    fold = str.casefold if _case_insensitive(directory, renames) else None
+    chains, conflicts = order_renames(renames, occupied, fold)
+    builder = PlanBuilder()
+    for group, chain in enumerate(chains):
+        for old, new in chain:
+            builder.add(directory, old, directory, new, group=group)
+    for old, new in conflicts:
+        builder.add(directory, old, directory, new, conflict=True)
+    return builder.build()
+
+def _skipped_message(directory, old_path, new_path):
+    """Why a conflicting rename in a plan was skipped"""
+    new_name = new_path[len(os.path.join(directory, '')):]
+    reason = "target exists" if valid_file_name(new_name) else "not a plain file name"
+    return f"Skipped: {os.path.basename(old_path)} -> {new_name!r} ({reason})"
+
+def _progress_reporter():
+    """Progress callback for MovePlan.execute that emits progress events with a rate"""
+    start = time.perf_counter()
+    
+    def report(done, total):
+        elapsed = time.perf_counter() - start
+        events.progress(done, total, done / elapsed if elapsed > 0 else None)
+    return report
+
+def _executed_renames(plan, errors):
+    """Pair each old -> new name in an executed rename plan with whether it happened"""
+    failed = {path for path, _ in errors}
+    for chain in plan.chains():
+        parked = {}
+        for old_path, new_path in chain:
+            old_name, new_name = os.path.basename(old_path), os.path.basename(new_path)
+            if new_name.startswith(TEMP_PREFIX):
+                parked[new_name] = old_name
+            else:
+                # A file went through only if its last step did
+                yield parked.pop(old_name, old_name), new_name, old_path not in failed
+
+def _locate(directory, operations):
+    """Find each operation's file by inode; returns its current name, or None if it is gone"""
+    names = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            names.setdefault(entry.inode(), []).append(entry.name)
+    located = []
+    for operation in operations:
+        candidates = names.get(operation['inode'], ())
+        if operation['new_name'] in candidates:
+            located.append(operation['new_name'])
+        elif operation['old_name'] in candidates:
+            located.append(operation['old_name'])
+        else:
+            located.append(candidates[0] if candidates else None)
+    return located
+
+def _finish_session(session_id, directory, operations, report=True):
+    """Check which journaled renames happened and commit just those to the history"""
+    completed = []
+    for seq, (operation, current) in enumerate(zip(operations, _locate(directory, operations))):
+        if current == operation['new_name']:
+            completed.append(operation.get('seq', seq))
+            if report:
+                emit(f"Renamed: {operation['old_name']} -> {operation['new_name']}")
+        elif current is not None and current.startswith(TEMP_PREFIX):
+            emit(f"⚠️ {operation['old_name']} was left as {current} in {directory}", kind='warning')
+    rename_history.retain(session_id, completed)
+    return len(completed)
+
+def plan_batch_rename(directory, prefix, template=None, pattern=None, sort='natural', reverse=False):
+    """Work out the renames batch_rename would make, without renaming.
+
+    The whole permutation is planned at once: files may take names that
+    other files in the batch are giving up, and cycles are resolved with
+    temporary names. Returns a MovePlan whose chains must each run in
+    order; renames whose target is held by something else (a folder, say)
+    are marked as conflicts.
+    """
+    files, others, renames = _new_names(directory, prefix, template, pattern, sort, reverse)
+    return _build_rename_plan(directory, renames, others)
+
+def batch_rename(directory, prefix, dry_run=False, workers=1, template=None, pattern=None,
+                 sort='natural', reverse=False, cancel=None):
+    """Rename every file in a directory to prefix_001.ext, prefix_002.ext, ...
+
+    Alternatively a rename template (see rename_templates) gives the new
+    names, e.g. "{1|lower}_{date}_{n}{ext}" with a regex pattern to
+    capture from; only files matching the pattern are renamed. Counters
+    grow past three digits as needed, so names keep sorting in order.
+
+    Files are numbered in a stable order: sort is one of SORT_ORDERS
+    ('natural' by default, so file2 comes before file10; 'mtime', 'size'
+    and 'ext' break ties naturally by name), reversed with reverse=True.
+
+    The intended renames, with each file's inode, are journaled before
+    anything is touched, so an interrupted run can be resumed or rolled
+    back on the next start (see recover_interrupted_rename). With
+    workers > 1 independent rename chains run on a thread pool.
+
+    cancel, a threading.Event, stops the run between blocks of renames;
+    what was renamed so far is recorded as usual and can be undone.
+    """
     try:
         if not os.path.exists(directory):
-            print(f"Error: Directory '{directory}' does not exist.")
+            emit(f"Error: Directory '{directory}' does not exist.", kind='error')
             return False
         
-        files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-        if not files:
-            print(f"No files found in directory '{directory}'.")
+        files, others, renames = _new_names(directory, prefix, template, pattern, sort, reverse)
+        plan = _build_rename_plan(directory, renames, others)
+        if not len(plan):
+            emit(f"No files to rename in directory '{directory}'.")
             return False
         
-        # Create a rename session
+        if dry_run:
+            for old_path, new_path, conflict in plan:
+                old_name, new_name = os.path.basename(old_path), os.path.basename(new_path)
+                if conflict:
+                    emit(_skipped_message(directory, old_path, new_path), kind='warning')
+                elif not new_name.startswith(TEMP_PREFIX):
+                    emit(f"Would rename: {old_name} -> {new_name}")
+            summary = plan.summary()
+            emit(f"\n📝 Dry run: {summary['moves']} renames planned, {summary['conflicts']} skipped.")
+            return plan
+        
+        for old_path, new_path in plan.conflicts:
+            emit(_skipped_message(directory, old_path, new_path), kind='warning')
+        
+        # Journal the intent first: a crash from here on leaves a pending session to recover
         session = {
             'timestamp': datetime.now().isoformat(),
             'directory': directory,
-            'prefix': prefix,
-            'operations': []
+            'prefix': template or prefix,
+            'operations': [{'old_name': old_name, 'new_name': new_name, 'inode': files[old_name]}
+                           for old_name, new_name, _ in _executed_renames(plan, ())]
         }
+        session_id = rename_history.begin(session)
         
-        success_count = 0
-        for idx, filename in enumerate(files, 1):
-            try:
-                ext = os.path.splitext(filename)[1]
-                new_name = f"{prefix}_{idx:03d}{ext}"
-                old_path = os.path.join(directory, filename)
-                new_path = os.path.join(directory, new_name)
-                
-                # Skip if target file already exists
-                if os.path.exists(new_path) and old_path != new_path:
-                    print(f"Skipped: {filename} -> {new_name} (target exists)")
-                    continue
-                
-                os.rename(old_path, new_path)
-                
-                # Record the operation for undo
-                session['operations'].append({
-                    'old_name': filename,
-                    'new_name': new_name,
-                    'old_path': old_path,
-                    'new_path': new_path
-                })
-                
-                success_count += 1
-                print(f"Renamed: {filename} -> {new_name}")
-                
-            except Exception as e:
-                print(f"Error renaming {filename}: {e}")
+        result = plan.execute(workers, _progress_reporter(), cancel)
+        for path, error in result['errors']:
+            if error != "cancelled":
+                emit(f"Error renaming {os.path.basename(path)}: {error}", kind='error')
+        
+        success_count = _finish_session(session_id, directory, session['operations'])
+        if result['cancelled']:
+            emit(f"🛑 Renaming cancelled after {success_count} files.", kind='warning')
         
         if success_count > 0:
-            # Add session to history and save
-            rename_history.append(session)
-            save_rename_history()
-            print(f"\n✅ Successfully renamed {success_count} files in {directory} with prefix '{prefix}'.")
-            print(f"📝 Rename session saved. Use undo_last_rename() or undo_rename_session() to revert.")
+            naming = f"template '{template}'" if template else f"prefix '{prefix}'"
+            emit(f"\n✅ Successfully renamed {success_count} files in {directory} with {naming}.")
+            emit(f"📝 Rename session saved. Use undo_last_rename() or undo_rename_session() to revert.")
         else:
-            print("❌ No files were renamed.")
+            emit("❌ No files were renamed.", kind='error')
+        events.result(renamed=success_count, skipped=len(plan.conflicts))
             
         return success_count > 0
         
     except Exception as e:
-        print(f"Error renaming files: {e}")
+        emit(f"Error renaming files: {e}", kind='error')
+        return False
+
+def interrupted_sessions():
+    """Rename sessions that were journaled but never finished, e.g. after a crash"""
+    try:
+        return rename_history.pending()
+    except Exception as e:
+        emit(f"Warning: Could not read the rename journal: {e}", kind='warning')
+        return []
+
+def recover_interrupted_rename(session, action='resume', workers=1):
+    """Resume or roll back an interrupted rename session.
+
+    Each file is found by the inode journaled with its rename, so it does
+    not matter how far the run got. 'resume' carries out the renames that
+    had not happened and records the session in the history; 'rollback'
+    restores the original names. Files that disappeared meanwhile are
+    left out.
+    """
+    directory = session['directory']
+    operations = session['operations']
+    verb = 'Resuming' if action == 'resume' else 'Rolling back'
+    emit(f"🔁 {verb} interrupted rename session from {session['timestamp']}")
+    emit(f"📁 Directory: {directory}")
+    try:
+        if not os.path.isdir(directory):
+            emit(f"❌ Directory no longer exists: {directory}", kind='error')
+            rename_history.retain(session['id'], [])
+            return False
+        
+        key = 'new_name' if action == 'resume' else 'old_name'
+        located = _locate(directory, operations)
+        renames = {current: operation[key] for operation, current in zip(operations, located)
+                   if current is not None and current != operation[key]}
+        missing = located.count(None)
+        if missing:
+            emit(f"⚠️ {missing} files are no longer in the directory and were left out.", kind='warning')
+        
+        present = set(os.listdir(directory))
+        plan = _build_rename_plan(directory, renames, present - set(renames))
+        for old_path, new_path in plan.conflicts:
+            emit(_skipped_message(directory, old_path, new_path), kind='warning')
+        result = plan.execute(workers, _progress_reporter())
+        for path, error in result['errors']:
+            emit(f"Error renaming {os.path.basename(path)}: {error}", kind='error')
+        
+        # Whatever still carries its new name stays in the history, so it can be undone later
+        renamed = _finish_session(session['id'], directory, operations, report=False)
+        if action == 'resume':
+            emit(f"✅ Resumed session: {renamed} of {len(operations)} files renamed.")
+        else:
+            emit(f"✅ Rolled back: {len(operations) - missing - renamed} files have their original names, "
+                 f"{renamed} could not be restored.")
+        return True
+    except Exception as e:
+        emit(f"Error recovering rename session: {e}", kind='error')
         return False
 
-def undo_last_rename():
+def undo_last_rename(workers=1, cancel=None):
     """Undo the most recent rename operation"""
-    global rename_history
-    
     if not rename_history:
-        print("❌ No rename operations to undo.")
+        emit("❌ No rename operations to undo.", kind='error')
         return False
     
-    session = rename_history[-1]
-    return undo_rename_session(len(rename_history) - 1)
+    return undo_rename_session(len(rename_history) - 1, workers, cancel)
 
-def undo_rename_session(session_index):
-    """Undo a specific rename session by index"""
-    global rename_history
-    
+def undo_rename_session(session_index, workers=1, cancel=None):
+    """Undo a specific rename session by index.
+
+    The session is checked against a single scan of its directory, then
+    all restores run as one rename plan (chains spread over `workers`
+    threads, swaps and cycles handled). If some files cannot be restored,
+    only their operations stay in the history so the undo can be retried;
+    the same goes for an undo stopped early by setting the cancel Event.
+    """
     if session_index < 0 or session_index >= len(rename_history):
-        print(f"❌ Invalid session index: {session_index}")
+        emit(f"❌ Invalid session index: {session_index}", kind='error')
+        return False
+    
+    return _undo_session(rename_history[session_index], workers, cancel)
+
+def undo_rename_session_by_id(session_id, workers=1, cancel=None):
+    """Undo a rename session by its id, which unlike its index never shifts"""
+    session = rename_history.get(session_id)
+    if session is None:
+        emit(f"❌ Rename session #{session_id} is no longer in history.", kind='error')
         return False
     
-    session = rename_history[session_index]
+    return _undo_session(session, workers, cancel)
+
+def _undo_session(session, workers, cancel):
     directory = session['directory']
     
     if not os.path.exists(directory):
-        print(f"❌ Directory no longer exists: {directory}")
+        emit(f"❌ Directory no longer exists: {directory}", kind='error')
         return False
     
-    print(f"🔄 Undoing rename session from {session['timestamp']}")
-    print(f"📁 Directory: {directory}")
-    print(f"🏷️ Prefix: {session['prefix']}")
-    
-    success_count = 0
-    failed_operations = []
+    emit(f"🔄 Undoing rename session from {session['timestamp']}")
+    emit(f"📁 Directory: {directory}")
+    emit(f"🏷️ Prefix: {session['prefix']}")
     
-    # Reverse the operations (undo in reverse order)
-    for operation in reversed(session['operations']):
-        try:
-            old_name = operation['old_name']
-            new_name = operation['new_name']
-            # Current path (what the file is named now)
-            current_path = os.path.join(directory, new_name)
-            # Target path (what we want to rename it back to)
-            target_path = os.path.join(directory, old_name)
-            
-            if not os.path.exists(current_path):
-                print(f"⚠️ File not found: {new_name} (may have been moved or deleted)")
-                failed_operations.append(operation)
-                continue
-            
-            if os.path.exists(target_path) and current_path != target_path:
-                print(f"⚠️ Cannot restore {new_name} -> {old_name} (target exists)")
-                failed_operations.append(operation)
+    try:
+        # Validate the whole session against one snapshot of the directory
+        with os.scandir(directory) as entries:
+            present = {entry.name for entry in entries}
+        by_new_name = {}
+        failed_seqs = []
+        for operation in session['operations']:
+            if operation['new_name'] not in present:
+                emit(f"⚠️ File not found: {operation['new_name']} (may have been moved or deleted)",
+                     kind='warning')
+                failed_seqs.append(operation['seq'])
                 continue
-            
-            os.rename(current_path, target_path)
-            print(f"✅ Restored: {new_name} -> {old_name}")
-            success_count += 1
-            
-        except Exception as e:
-            print(f"❌ Error restoring {operation['new_name']}: {e}")
-            failed_operations.append(operation)
+            by_new_name[operation['new_name']] = operation
+        restores = {new_name: operation['old_name'] for new_name, operation in by_new_name.items()}
+        
+        plan = _build_rename_plan(directory, restores, present - set(restores))
+        for old_path, new_path in plan.conflicts:
+            emit(f"⚠️ Cannot restore {os.path.basename(old_path)} -> {os.path.basename(new_path)} (target exists)",
+                 kind='warning')
+            failed_seqs.append(by_new_name[os.path.basename(old_path)]['seq'])
+        
+        result = plan.execute(workers, _progress_reporter(), cancel)
+        if result['cancelled']:
+            emit("🛑 Undo cancelled; the files not restored stay in history.", kind='warning')
+        for path, error in result['errors']:
+            if not error.startswith("skipped") and error != "cancelled":
+                emit(f"❌ Error restoring {os.path.basename(path)}: {error}", kind='error')
+        
+        success_count = 0
+        for new_name, old_name, restored in _executed_renames(plan, result['errors']):
+            if restored:
+                emit(f"✅ Restored: {new_name} -> {old_name}")
+                success_count += 1
+            else:
+                failed_seqs.append(by_new_name[new_name]['seq'])
+        
+        # Keep only the operations that could not be undone
+        rename_history.retain(session['id'], failed_seqs)
+    except Exception as e:
+        emit(f"❌ Error undoing rename session: {e}", kind='error')
+        return False
     
     if success_count > 0:
-        # Remove the session from history if all operations were successful
-        if not failed_operations:
-            rename_history.pop(session_index)
-            save_rename_history()
-            print(f"\n✅ Successfully undid {success_count} rename operations.")
-            print("📝 Session removed from history.")
+        if not failed_seqs:
+            emit(f"\n✅ Successfully undid {success_count} rename operations.")
+            emit("📝 Session removed from history.")
         else:
-            print(f"\n⚠️ Partially undid {success_count} operations. {len(failed_operations)} operations failed.")
+            emit(f"\n⚠️ Partially undid {success_count} operations. {len(failed_seqs)} operations failed.",
+                 kind='warning')
+            emit("📝 Only the failed operations remain in history; undo the session again to retry them.")
     else:
-        print("❌ No operations could be undone.")
+        emit("❌ No operations could be undone.", kind='error')
+    events.result(restored=success_count, failed=len(failed_seqs))
     
     return success_count > 0
 
-def list_rename_history():
-    """List all rename sessions in history"""
-    if not rename_history:
-        print("📝 No rename history found.")
+def query_rename_history(offset=0, limit=HISTORY_PAGE_SIZE, **filters):
+    """Fetch one page of rename sessions, newest first.
+
+    Filters: directory, prefix, filename, since, until. Returns the page of
+    session summaries and the number of sessions matching the filters.
+    """
+    return rename_history.query(offset, limit, **filters), rename_history.count(**filters)
+
+def list_rename_history(page=0, page_size=HISTORY_PAGE_SIZE, **filters):
+    """List one page of rename sessions, newest first"""
+    sessions, total = query_rename_history(page * page_size, page_size, **filters)
+    if not total:
+        emit("📝 No rename history found.")
         return []
     
-    print("📋 Rename History:")
-    print("=" * 60)
+    pages = -(-total // page_size)
+    emit(f"📋 Rename History (page {page + 1} of {pages}, {total} sessions):")
+    emit("=" * 60)
     
-    for i, session in enumerate(rename_history):
+    for session in sessions:
         timestamp = session['timestamp']
         directory = session['directory']
         prefix = session['prefix']
-        num_operations = len(session['operations'])
+        num_operations = session['count']
         
-        print(f"[{i}] {timestamp}")
-        print(f"    📁 Directory: {directory}")
-        print(f"    🏷️ Prefix: {prefix}")
-        print(f"    📊 Files renamed: {num_operations}")
-        print("-" * 60)
+        emit(f"[{session['index']}] {timestamp}")
+        emit(f"    📁 Directory: {directory}")
+        emit(f"    🏷️ Prefix: {prefix}")
+        emit(f"    📊 Files renamed: {num_operations}")
+        emit("-" * 60)
+    events.result(sessions=sessions, total=total)
     
-    return rename_history
+    return sessions
 
 def clear_rename_history():
     """Clear all rename history"""
-    global rename_history
-    rename_history = []
     try:
-        if os.path.exists('rename_history.json'):
-            os.remove('rename_history.json')
-        print("✅ Rename history cleared.")
+        rename_history.clear()
+        emit("✅ Rename history cleared.")
     except Exception as e:
-        print(f"⚠️ Error clearing history file: {e}")
-
-# Load history on module import
-load_rename_history()
+        emit(f"⚠️ Error clearing history file: {e}", kind='warning')
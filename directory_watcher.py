@@ -0,0 +1,216 @@
+"""
+Directory Watcher
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from events import emit
+from file_organizer import DEFAULT_BATCH_SIZE, iter_files, organize_files_by_extension
+
+# Quiet period after the last event before watch mode organizes a batch
+DEFAULT_COALESCE_DELAY = 0.5
+# Longest a file waits in watch mode while events keep arriving
+DEFAULT_MAX_DELAY = 5.0
+# Seconds between directory checks when inotify is not available
+DEFAULT_POLL_INTERVAL = 2.0
+
+# inotify constants from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+class _InotifySource:
+    """Names of files closed after writing or moved into a directory (Linux)"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, os.strerror(err))
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds; return (names, queue_overflowed)"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        names = []
+        overflowed = False
+        if not ready:
+            return names, overflowed
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                offset += _INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    overflowed = True
+                elif name and not mask & _IN_ISDIR:
+                    names.append(os.fsdecode(name))
+        return names, overflowed
+
+    def close(self):
+        os.close(self._fd)
+
+class _PollingSource:
+    """Fallback event source diffing listings; a file is reported once its size and mtime hold still"""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._dir_mtime = os.stat(directory).st_mtime_ns
+        self._known = self._snapshot()
+        self._candidates = {}
+
+    def _snapshot(self):
+        files = {}
+        for entry in iter_files(self.directory):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files[entry.name] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds; return (names, queue_overflowed)"""
+        time.sleep(min(timeout, self.interval))
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        if mtime_ns == self._dir_mtime and not self._candidates:
+            return [], False
+        self._dir_mtime = mtime_ns
+        current = self._snapshot()
+        ready = []
+        candidates = {}
+        for name, signature in current.items():
+            if self._known.get(name) == signature:
+                continue
+            if self._candidates.get(name) == signature:
+                ready.append(name)
+            else:
+                candidates[name] = signature
+        self._candidates = candidates
+        self._known = {name: signature for name, signature in current.items()
+                       if name not in candidates}
+        return ready, False
+
+    def close(self):
+        pass
+
+class DirectoryWatcher:
+    """Keep a directory organized as new files arrive, in coalesced batches"""
+
+    def __init__(self, directory, coalesce_delay=DEFAULT_COALESCE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 max_batch=DEFAULT_BATCH_SIZE, poll_interval=DEFAULT_POLL_INTERVAL,
+                 use_inotify=True, **organize_options):
+        self.directory = directory
+        self.coalesce_delay = coalesce_delay
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.organize_options = organize_options
+        self.mode = None
+        self.metrics = {
+            'events': 0,
+            'batches': 0,
+            'files': 0,
+            'queue_depth': 0,
+            'max_queue_depth': 0,
+            'last_latency': 0.0,
+            'avg_latency': 0.0,
+            'max_latency': 0.0,
+        }
+        self._stop = threading.Event()
+
+    def _open_source(self):
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.mode = 'inotify'
+                return _InotifySource(self.directory)
+            except (OSError, AttributeError) as e:
+                emit(f"⚠️ inotify unavailable ({e}), falling back to polling.", kind='warning')
+        self.mode = 'polling'
+        return _PollingSource(self.directory, self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Organize the directory, then keep watching it until stop() or Ctrl+C"""
+        if not os.path.isdir(self.directory):
+            emit(f"Error: Directory '{self.directory}' does not exist.", kind='error')
+            return
+        # Subscribe before the first pass so nothing arriving meanwhile is missed
+        source = self._open_source()
+        emit(f"👀 Watching {self.directory} ({self.mode}). Press Ctrl+C to stop.")
+        organize_files_by_extension(self.directory, **self.organize_options)
+
+        pending = {}
+        last_event = oldest = 0.0
+        try:
+            while not self._stop.is_set():
+                names, overflowed = source.poll(self.coalesce_delay if pending else 1.0)
+                now = time.monotonic()
+                if overflowed:
+                    emit("⚠️ Event queue overflowed, re-organizing the whole directory.", kind='warning')
+                    organize_files_by_extension(self.directory, **self.organize_options)
+                for name in names:
+                    if not pending:
+                        oldest = now
+                    pending.setdefault(name, now)
+                    last_event = now
+                self.metrics['events'] += len(names)
+                self.metrics['queue_depth'] = len(pending)
+                self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], len(pending))
+                if pending and (len(pending) >= self.max_batch
+                                or now - last_event >= self.coalesce_delay
+                                or now - oldest >= self.max_delay):
+                    self._organize_batch(pending)
+                    pending = {}
+                    self.metrics['queue_depth'] = 0
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.close()
+            emit(f"🛑 Stopped watching {self.directory}.")
+
+    def _organize_batch(self, pending):
+        organize_files_by_extension(self.directory, paths=list(pending), **self.organize_options)
+        done = time.monotonic()
+        latencies = [done - arrived for arrived in pending.values()]
+        metrics = self.metrics
+        total_before = metrics['files']
+        metrics['batches'] += 1
+        metrics['files'] += len(latencies)
+        metrics['last_latency'] = max(latencies)
+        metrics['max_latency'] = max(metrics['max_latency'], metrics['last_latency'])
+        metrics['avg_latency'] = ((metrics['avg_latency'] * total_before + sum(latencies))
+                                  / metrics['files'])
+        emit(f"📦 Batch {metrics['batches']}: {len(latencies)} files, "
+             f"latency {metrics['last_latency'] * 1000:.0f} ms "
+             f"(avg {metrics['avg_latency'] * 1000:.0f} ms), "
+             f"peak queue depth {metrics['max_queue_depth']}")
+
+def watch_directory(directory, **options):
+    """Organize a directory continuously until interrupted"""
+    watcher = DirectoryWatcher(directory, **options)
+    watcher.run()
+    return watcher.metrics
@@ -0,0 +1,167 @@
+"""
+Duplicate File Finder
+"""
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import app_state
+import events
+from events import emit
+from file_organizer import StatCache, report_errors, walk_files
+from move_plan import COPY_CHUNK_SIZE
+
+# Bytes hashed at each end of a file before deciding to hash all of it
+PARTIAL_HASH_BLOCK = 64 * 1024
+# Where duplicate detection remembers the hashes of files it already read
+DEDUP_CACHE_FILE = app_state.state_path('dedup_cache.db')
+
+def _hash_blocks(path, size):
+    """Hash the first and last PARTIAL_HASH_BLOCK bytes of a file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_BLOCK))
+        if size > 2 * PARTIAL_HASH_BLOCK:
+            f.seek(-PARTIAL_HASH_BLOCK, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_BLOCK))
+        elif size > PARTIAL_HASH_BLOCK:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def _hash_file(path):
+    """Hash a whole file (runs in a worker process)"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+
+def _cached_hash(cache, st, kind):
+    record = cache.get(st) if cache is not None else None
+    return record.get(kind) if record else None
+
+def _store_hash(cache, st, kind, value):
+    if cache is None:
+        return
+    record = dict(cache.get(st) or {})
+    record[kind] = value
+    cache.put(st, record)
+
+def _group_by(candidates, key):
+    """Split candidate groups by key(candidate), dropping groups of one"""
+    groups = []
+    for group in candidates:
+        buckets = defaultdict(list)
+        for candidate in group:
+            value = key(candidate)
+            if value is not None:
+                buckets[value].append(candidate)
+        groups.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+    return groups
+
+def find_duplicates(directory, recursive=True, exclude=(), action='report', workers=None,
+                    min_size=1, cache_file=DEDUP_CACHE_FILE):
+    """Find identical files below directories and report, hard-link or remove the copies"""
+    if action not in ('report', 'hardlink', 'remove'):
+        emit(f"Error: Unknown duplicate action '{action}'.", kind='error')
+        return None
+    try:
+        roots = [directory] if isinstance(directory, (str, os.PathLike)) else list(directory)
+        errors = []
+        cache = StatCache(cache_file) if cache_file else None
+
+        # Stage 1: size buckets, one stat per file from the directory walk
+        by_size = defaultdict(dict)
+        for _, entry, _ in walk_files(roots, errors, recursive, exclude=exclude):
+            try:
+                st = entry.stat()
+            except OSError as e:
+                errors.append((entry.path, str(e)))
+                continue
+            if st.st_size >= min_size:
+                # Hard links share an inode; keep one path per inode
+                by_size[st.st_size].setdefault((st.st_dev, st.st_ino), (entry.path, st))
+        candidates = [list(files.values()) for files in by_size.values() if len(files) > 1]
+        del by_size
+
+        # Stage 2: hash of the first and last block
+        def partial_hash(candidate):
+            path, st = candidate
+            value = _cached_hash(cache, st, 'partial')
+            if value is None:
+                try:
+                    value = _hash_blocks(path, st.st_size)
+                except OSError as e:
+                    errors.append((path, str(e)))
+                    return None
+                _store_hash(cache, st, 'partial', value)
+            return value
+
+        candidates = _group_by(candidates, partial_hash)
+
+        # Stage 3: full hash, only for files longer than the blocks already compared
+        to_hash = [candidate for group in candidates for candidate in group
+                   if candidate[1].st_size > 2 * PARTIAL_HASH_BLOCK
+                   and _cached_hash(cache, candidate[1], 'full') is None]
+        if to_hash:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_hash_file, path): (path, st) for path, st in to_hash}
+                for future, (path, st) in futures.items():
+                    try:
+                        _store_hash(cache, st, 'full', future.result())
+                    except OSError as e:
+                        errors.append((path, str(e)))
+
+        def full_hash(candidate):
+            path, st = candidate
+            if st.st_size <= 2 * PARTIAL_HASH_BLOCK:
+                return 'partial'  # the partial hash already covered the whole file
+            return _cached_hash(cache, st, 'full')
+
+        groups = [sorted(group, key=lambda candidate: candidate[0])
+                  for group in _group_by(candidates, full_hash)]
+        if cache is not None:
+            cache.save()
+
+        wasted = sum(group[0][1].st_size * (len(group) - 1) for group in groups)
+        result = {'groups': [[path for path, _ in group] for group in groups],
+                  'wasted_bytes': wasted, 'errors': errors}
+        if not groups:
+            emit("✅ No duplicate files found.")
+            events.result(**result)
+            return result
+
+        for group in result['groups']:
+            emit(f"🔁 {group[0]}")
+            for path in group[1:]:
+                emit(f"    = {path}")
+                if action != 'report':
+                    try:
+                        _replace_duplicate(group[0], path, action)
+                    except OSError as e:
+                        errors.append((path, str(e)))
+        report_errors(errors, 'deduplicating')
+        verb = {'report': 'Found', 'hardlink': 'Hard-linked', 'remove': 'Removed'}[action]
+        count = sum(len(group) - 1 for group in groups)
+        emit(f"{verb} {count} duplicate files ({wasted / (1024**2):.1f} MB).")
+        events.result(**result)
+        return result
+    except Exception as e:
+        emit(f"Error finding duplicates: {e}", kind='error')
+        return None
+
+def _replace_duplicate(original, duplicate, action):
+    """Remove a duplicate or swap it for a hard link to the original"""
+    if action == 'remove':
+        os.remove(duplicate)
+        return
+    temp_path = f"{duplicate}.dedup-tmp"
+    os.link(original, temp_path)
+    try:
+        os.replace(temp_path, duplicate)
+    except OSError:
+        os.remove(temp_path)
+        raise
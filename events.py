@@ -0,0 +1,55 @@
+"""
+Progress and Result Events
+
+The organizer, renamer and system monitor report what they do through
+emit() instead of print(). Without a listener (the CLI) an event's message
+is simply printed. A thread that runs its work inside listen(callback)
+receives every event as an Event instead; listeners are kept per thread,
+so tasks running side by side never see each other's output.
+
+Event kinds:
+    'message'   ordinary output
+    'warning'   something was skipped or only partly done
+    'error'     something failed
+    'progress'  data: done, and optionally total and rate (per second)
+    'result'    data: the values the task returns, e.g. files moved
+"""
+import threading
+from collections import namedtuple
+
+Event = namedtuple('Event', 'kind message data')
+
+_local = threading.local()
+
+def emit(message='', kind='message', **data):
+    """Send an event to this thread's listener, or print its message"""
+    listener = getattr(_local, 'listener', None)
+    if listener is None:
+        if message:
+            print(message)
+        return
+    listener(Event(kind, message, data))
+
+def progress(done, total=None, rate=None, message=''):
+    """Report how far a task has got"""
+    emit(message, 'progress', done=done, total=total, rate=rate)
+
+def result(message='', **data):
+    """Report a task's outcome"""
+    emit(message, 'result', **data)
+
+class listen:
+    """Context manager routing this thread's events to listener(event)"""
+
+    def __init__(self, listener):
+        self.listener = listener
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'listener', None)
+        _local.listener = self.listener
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.listener = self.previous
+        return False
@@ -1,32 +1,775 @@
 """
 Intelligent File Organizer
 """
+import fnmatch
+import json
 import os
-import shutil
+import queue
+import sqlite3
+import stat
+import threading
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-def organize_files_by_extension(directory):
-    try:
-        if not os.path.exists(directory):
-            print(f"Error: Directory '{directory}' does not exist.")
+import app_state
+import events
+from events import emit
+from move_plan import PlanBuilder, execute_moves
+
+# Number of files classified before a streaming run flushes its moves
+DEFAULT_BATCH_SIZE = 1000
+# Threads listing directories concurrently in a recursive run
+DEFAULT_WALKERS = 8
+# Files handed from the directory walkers to the mover per queue item
+WALK_CHUNK_SIZE = 512
+# Chunks the walkers may run ahead of the mover
+WALK_QUEUE_SIZE = 64
+# Where incremental runs keep their snapshot of already processed entries
+ORGANIZER_INDEX_FILE = app_state.state_path('organizer_index.db')
+
+def iter_files(directory, subdirs=None, skip=()):
+    """Yield a DirEntry for every file in a directory, appending subdirectories to subdirs if given"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if skip and os.path.normcase(entry.name) in skip:
+                continue
+            try:
+                # DirEntry caches the type reported by the directory listing,
+                # so this usually costs no extra stat call
+                if entry.is_file():
+                    yield entry
+                elif subdirs is not None and entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+            except OSError:
+                continue
+
+def _is_excluded(name, relative_path, exclude):
+    """Check a file or folder against the exclude globs"""
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern)
+               for pattern in exclude)
+
+class SnapshotIndex:
+    """What earlier organizer runs already looked at (directory mtimes and known files), kept in SQLite"""
+
+    def __init__(self, path=ORGANIZER_INDEX_FILE):
+        self.path = path
+        self.dirs_skipped = 0
+        self.files_skipped = 0
+        self._lock = threading.Lock()
+        self._listed_dirs = []
+        self._conn = sqlite3.connect(app_state.prepare(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS dirs "
+                           "(path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                           "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+        self._conn.commit()
+
+    def unchanged_subdirs(self, path, mtime_ns):
+        """Return the stored subdirectories of path, or None if it changed"""
+        with self._lock:
+            row = self._conn.execute("SELECT mtime_ns, subdirs FROM dirs WHERE path = ?",
+                                     (path,)).fetchone()
+            if row is None or row[0] != mtime_ns:
+                return None
+            self.dirs_skipped += 1
+        return json.loads(row[1])
+
+    def record_dir(self, path, mtime_ns, subdirs):
+        """Note a listed directory; it is stored by commit_dirs()"""
+        with self._lock:
+            self._listed_dirs.append((path, mtime_ns, json.dumps(subdirs)))
+
+    def commit_dirs(self, skip=()):
+        """Store the listed directories, except those in skip that still hold failed files"""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                                   [row for row in self._listed_dirs if row[0] not in skip])
+            self._conn.commit()
+            self._listed_dirs = []
+
+    def refresh_dir(self, path, previous_mtime_ns):
+        """Move a directory's stored mtime past our own changes, unless something else touched it"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            self._conn.execute("UPDATE dirs SET mtime_ns = ? WHERE path = ? AND mtime_ns = ?",
+                               (mtime_ns, path, previous_mtime_ns))
+
+    def is_known(self, path, st):
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns FROM entries WHERE path = ?",
+                                     (path,)).fetchone()
+            known = row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns
+            if known:
+                self.files_skipped += 1
+        return known
+
+    def record_entries(self, rows):
+        """Store (path, size, mtime_ns) rows and commit"""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+class _TreeWalker:
+    """Enumerate directory trees with worker threads sharing one queue of directories to list"""
+
+    _DONE = object()
+
+    def __init__(self, roots, errors, max_depth=None, exclude=(), workers=DEFAULT_WALKERS,
+                 prune=(), index=None):
+        self.roots = roots
+        self.errors = errors
+        self.max_depth = max_depth
+        self.exclude = tuple(exclude)
+        self.workers = max(1, workers)
+        self.prune = {os.path.realpath(path) for path in prune}
+        self.index = index
+        self.state_files = app_state.state_names_by_dir([index.path] if index is not None else ())
+        self._dirs = queue.Queue()
+        self._results = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+        self._outstanding = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def __iter__(self):
+        """Yield (root, DirEntry, st_dev) for every file below the roots"""
+        for root in self.roots:
+            self._push(root, root, 0)
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._results.get()
+                if item is self._DONE:
+                    return
+                yield from item
+        finally:
+            self._stopped.set()
+            for _ in threads:
+                self._dirs.put(None)
+
+    def _push(self, root, path, depth):
+        with self._lock:
+            self._outstanding += 1
+        self._dirs.put((root, path, depth))
+
+    def _descend(self, root, path, depth):
+        """Queue a subdirectory unless it is too deep, excluded or pruned"""
+        if self.max_depth is not None and depth >= self.max_depth:
+            return
+        if self.exclude and _is_excluded(os.path.basename(path), os.path.relpath(path, root),
+                                         self.exclude):
             return
-        
-        files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-        if not files:
-            print(f"No files found in directory '{directory}'.")
+        if os.path.realpath(path) in self.prune:
             return
-        
-        ext_map = defaultdict(list)
-        for f in files:
-            ext = os.path.splitext(f)[1][1:] or 'no_extension'
-            ext_map[ext].append(f)
-        
-        for ext, files in ext_map.items():
-            ext_dir = os.path.join(directory, ext)
-            os.makedirs(ext_dir, exist_ok=True)
-            for f in files:
-                shutil.move(os.path.join(directory, f), os.path.join(ext_dir, f))
-        
-        print(f"Organized {len(files)} files in {directory} by extension.")
+        self._push(root, path, depth + 1)
+
+    def _emit(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _work(self):
+        while True:
+            job = self._dirs.get()
+            if job is None or self._stopped.is_set():
+                return
+            try:
+                self._list(*job)
+            finally:
+                with self._lock:
+                    self._outstanding -= 1
+                    finished = self._outstanding == 0
+                if finished:
+                    self._emit(self._DONE)
+                    for _ in range(self.workers):
+                        self._dirs.put(None)
+
+    def _list(self, root, path, depth):
+        files = []
+        subdirs = []
+        index = self.index
+        skip = app_state.skipped_names(path, self.state_files)
+        try:
+            st = os.stat(path)
+            if index is not None:
+                known_subdirs = index.unchanged_subdirs(path, st.st_mtime_ns)
+                if known_subdirs is not None:
+                    for subdir in known_subdirs:
+                        self._descend(root, subdir, depth)
+                    return
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            self._descend(root, entry.path, depth)
+                            continue
+                        if self.exclude and _is_excluded(entry.name, os.path.relpath(entry.path, root),
+                                                         self.exclude):
+                            continue
+                        if skip and os.path.normcase(entry.name) in skip:
+                            continue
+                        if entry.is_file():
+                            if index is not None and index.is_known(entry.path, entry.stat()):
+                                continue
+                            files.append((root, entry, st.st_dev))
+                            if len(files) >= WALK_CHUNK_SIZE:
+                                self._emit(files)
+                                files = []
+                    except OSError:
+                        continue
+            if files:
+                self._emit(files)
+            if index is not None and not self._stopped.is_set():
+                index.record_dir(path, st.st_mtime_ns, subdirs)
+        except FileNotFoundError:
+            if depth == 0:
+                with self._lock:
+                    self.errors.append((path, "directory not found"))
+        except OSError as e:
+            with self._lock:
+                self.errors.append((path, str(e)))
+
+class _PathEntry:
+    """Minimal stand-in for os.DirEntry when files are known by path"""
+
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = None
+
+    def stat(self, follow_symlinks=True):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_file(self, follow_symlinks=True):
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+    def inode(self):
+        return self.stat().st_ino
+
+def _path_entries(root, paths, errors, exclude=()):
+    """Yield (root, entry, st_dev) for an explicit list of files in root"""
+    state_files = app_state.state_names_by_dir()
+    for path in paths:
+        entry = _PathEntry(os.path.join(root, path))
+        if exclude and _is_excluded(entry.name, entry.name, exclude):
+            continue
+        if os.path.normcase(entry.name) in app_state.skipped_names(os.path.dirname(entry.path),
+                                                                   state_files):
+            continue
+        try:
+            if entry.is_file():
+                yield root, entry, entry.stat().st_dev
+        except OSError as e:
+            errors.append((entry.path, str(e)))
+
+def walk_files(roots, errors, recursive=False, max_depth=None, exclude=(),
+                walkers=DEFAULT_WALKERS, prune=(), index=None):
+    """Yield (root, DirEntry, st_dev) for every file to organize, skipping what the index already knows"""
+    if recursive:
+        yield from _TreeWalker(roots, errors, max_depth, exclude, walkers, prune, index)
+        return
+    state_files = app_state.state_names_by_dir([index.path] if index is not None else ())
+    for root in roots:
+        try:
+            st = os.stat(root)
+            if index is not None and index.unchanged_subdirs(root, st.st_mtime_ns) is not None:
+                continue
+            subdirs = [] if index is not None else None
+            for entry in iter_files(root, subdirs, app_state.skipped_names(root, state_files)):
+                if exclude and _is_excluded(entry.name, entry.name, exclude):
+                    continue
+                if index is not None and index.is_known(entry.path, entry.stat()):
+                    continue
+                yield root, entry, st.st_dev
+            if index is not None:
+                index.record_dir(root, st.st_mtime_ns, subdirs)
+        except OSError as e:
+            errors.append((root, str(e)))
+
+def _extension_folder(filename):
+    """Return the folder name a file is organized into"""
+    return os.path.splitext(filename)[1][1:] or 'no_extension'
+
+def classify_by_extension(entry):
+    """Default classifier: the folder is the file extension"""
+    return _extension_folder(entry.name)
+
+# (offset, signature, folder) checked in order against the head of a file
+MAGIC_SIGNATURES = [
+    (0, b'%PDF-', 'pdf'),
+    (0, b'\x89PNG\r\n\x1a\n', 'png'),
+    (0, b'\xff\xd8\xff', 'jpg'),
+    (0, b'GIF87a', 'gif'),
+    (0, b'GIF89a', 'gif'),
+    (0, b'BM', 'bmp'),
+    (0, b'II*\x00', 'tiff'),
+    (0, b'MM\x00*', 'tiff'),
+    (0, b'\x00\x00\x01\x00', 'ico'),
+    (0, b'8BPS', 'psd'),
+    (8, b'WEBP', 'webp'),
+    (8, b'WAVE', 'wav'),
+    (8, b'AVI ', 'avi'),
+    (4, b'ftyp', 'mp4'),
+    (0, b'ID3', 'mp3'),
+    (0, b'\xff\xfb', 'mp3'),
+    (0, b'fLaC', 'flac'),
+    (0, b'OggS', 'ogg'),
+    (0, b'\x1aE\xdf\xa3', 'mkv'),
+    (0, b'PK\x03\x04', 'zip'),
+    (0, b'PK\x05\x06', 'zip'),
+    (0, b'\x1f\x8b', 'gz'),
+    (0, b'BZh', 'bz2'),
+    (0, b'\xfd7zXZ\x00', 'xz'),
+    (0, b'7z\xbc\xaf\x27\x1c', '7z'),
+    (0, b'Rar!\x1a\x07', 'rar'),
+    (257, b'ustar', 'tar'),
+    (0, b'SQLite format 3\x00', 'sqlite'),
+    (0, b'MZ', 'exe'),
+    (0, b'\x7fELF', 'elf'),
+    (0, b'\x00asm', 'wasm'),
+    (0, b'wOFF', 'woff'),
+    (0, b'wOF2', 'woff2'),
+    (0, b'{\\rtf', 'rtf'),
+    (0, b'%!PS', 'ps'),
+    (0, b'<?xml', 'xml'),
+    (0, b'#!', 'script'),
+]
+
+# Extensions trusted when the content matches a more generic signature
+# (an .xlsx is a zip, a .mov shares the mp4 container, ...)
+SIGNATURE_ALIASES = {
+    'jpg': {'jpeg', 'jpe', 'jfif'},
+    'tiff': {'tif', 'dng', 'cr2', 'nef'},
+    'mp4': {'m4a', 'm4v', 'mov', '3gp', 'heic', 'avif'},
+    'ogg': {'oga', 'ogv', 'opus'},
+    'mkv': {'webm'},
+    'zip': {'docx', 'xlsx', 'pptx', 'odt', 'ods', 'odp', 'jar', 'apk', 'epub', 'whl', 'xpi'},
+    'gz': {'tgz'},
+    'exe': {'dll', 'sys', 'scr'},
+    'elf': {'so', 'o', 'bin'},
+    'xml': {'svg', 'xhtml', 'plist', 'xsd', 'xsl'},
+    'script': {'sh', 'bash', 'py', 'pl', 'rb', 'js'},
+    'sqlite': {'db', 'sqlite3'},
+}
+
+# Text formats whose signature never overrides an explicit extension
+TEXT_SIGNATURE_FOLDERS = {'rtf', 'ps', 'xml', 'script'}
+
+# Bytes read from the start of a file to detect its type
+SNIFF_SIZE = 512
+# Where ContentClassifier remembers the type of files it already read
+CLASSIFY_CACHE_FILE = app_state.state_path('classify_cache.db')
+# Seconds a cache entry is kept after the last run that looked at its file
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+def sniff_file_type(head, filename=''):
+    """Work out the folder for a file from its first bytes, keeping an extension that agrees with them"""
+    ext = os.path.splitext(filename)[1][1:].lower()
+    for offset, signature, folder in MAGIC_SIGNATURES:
+        if not head.startswith(signature, offset):
+            continue
+        if ext == folder or ext in SIGNATURE_ALIASES.get(folder, ()):
+            return ext
+        if folder in TEXT_SIGNATURE_FOLDERS:
+            return ext or folder
+        if len(signature) <= 2 and b'\x00' not in head:
+            continue  # two-byte magic at the start of what looks like text
+        return folder
+    if ext:
+        return ext
+    if head and b'\x00' not in head:
+        lowered = head[:256].lstrip().lower()
+        if lowered.startswith((b'<!doctype html', b'<html')):
+            return 'html'
+        try:
+            head.decode('utf-8')
+            return 'txt'
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut at the end of the head is still text
+            if e.start >= len(head) - 3:
+                return 'txt'
+    return 'no_extension'
+
+class StatCache:
+    """Per-file values keyed on (device, inode), valid while size and mtime match, kept in SQLite"""
+
+    def __init__(self, path, max_age=CACHE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._conn = None
+        self._added = {}
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            try:
+                self._conn = sqlite3.connect(app_state.prepare(self.path), check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+                                   "size INTEGER, mtime_ns INTEGER, value TEXT, seen REAL)")
+                self._conn.commit()
+            except (OSError, sqlite3.Error) as e:
+                emit(f"Warning: Could not open cache {self.path}: {e}", kind='warning')
+                self._conn = False
+        return self._conn
+
+    @staticmethod
+    def _key(st):
+        # Some platforms report no inode from a directory listing
+        return f"{st.st_dev}:{st.st_ino}" if st.st_ino else None
+
+    def get(self, st):
+        key = self._key(st)
+        if key is None:
+            return None
+        with self._lock:
+            record = self._added.get(key)
+            if record is None and self._connect():
+                record = self._conn.execute("SELECT size, mtime_ns, value FROM entries WHERE key = ?",
+                                            (key,)).fetchone()
+        if record and record[0] == st.st_size and record[1] == st.st_mtime_ns:
+            with self._lock:
+                self._seen.add(key)
+            return json.loads(record[2])
+        return None
+
+    def put(self, st, value):
+        key = self._key(st)
+        if key is None:
+            return
+        with self._lock:
+            self._added[key] = (st.st_size, st.st_mtime_ns, json.dumps(value))
+
+    def save(self):
+        """Write new entries, mark the ones used as seen and prune the rest"""
+        with self._lock:
+            if not self._connect():
+                return
+            now = time.time()
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                       [(key, size, mtime_ns, value, now)
+                                        for key, (size, mtime_ns, value) in self._added.items()])
+                self._conn.executemany("UPDATE entries SET seen = ? WHERE key = ?",
+                                       [(now, key) for key in self._seen - self._added.keys()])
+                self._conn.execute("DELETE FROM entries WHERE seen < ?", (now - self.max_age,))
+                self._conn.commit()
+                self._added = {}
+                self._seen = set()
+            except sqlite3.Error as e:
+                emit(f"Warning: Could not save cache {self.path}: {e}", kind='warning')
+            finally:
+                self._conn.close()
+                self._conn = None
+
+class ContentClassifier:
+    """Classify files by their first SNIFF_SIZE bytes, cached per (inode, size, mtime)"""
+
+    def __init__(self, cache_file=CLASSIFY_CACHE_FILE):
+        self.cache = StatCache(cache_file) if cache_file else None
+        self.hits = 0
+        self.reads = 0
+
+    def __call__(self, entry):
+        st = entry.stat()
+        if self.cache is not None:
+            folder = self.cache.get(st)
+            if folder is not None:
+                self.hits += 1
+                return folder
+        try:
+            with open(entry.path, 'rb') as f:
+                head = f.read(SNIFF_SIZE)
+        except OSError:
+            return _extension_folder(entry.name)
+        self.reads += 1
+        folder = sniff_file_type(head, entry.name)
+        if self.cache is not None:
+            self.cache.put(st, folder)
+        return folder
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.save()
+
+def _resolve_classifier(classifier):
+    """Turn the classifier option into a callable taking a DirEntry"""
+    if classifier is None or classifier == 'extension':
+        return classify_by_extension
+    if classifier == 'content':
+        return ContentClassifier()
+    if callable(classifier):
+        return classifier
+    raise ValueError(f"Unknown classifier: {classifier!r}")
+
+def _prepare_folder(path, created_dirs, guard_collisions):
+    """Create a target folder once and remember its device, names (with guard_collisions) and mtime"""
+    if path not in created_dirs:
+        os.makedirs(path, exist_ok=True)
+        names = set(os.listdir(path)) if guard_collisions else None
+        st = os.stat(path)
+        created_dirs[path] = (st.st_dev, names, st.st_mtime_ns)
+    return created_dirs[path]
+
+def _move_batch(batch, created_dirs, executor=None, workers=1, guard_collisions=False, cancel=None):
+    """Move one batch of {target folder: [(source, name, st_dev)]}; returns (failed, bytes copied)"""
+    errors = []
+    pairs = []
+    for target_dir, items in batch.items():
+        try:
+            target_dev, names, _ = _prepare_folder(target_dir, created_dirs, guard_collisions)
+        except OSError as e:
+            errors.extend((source, str(e)) for source, _, _ in items)
+            continue
+        for source, name, source_dev in items:
+            if names is not None:
+                if name in names:
+                    errors.append((source, f"target exists in {target_dir}"))
+                    continue
+                names.add(name)
+            pairs.append((source, os.path.join(target_dir, name), source_dev != target_dev))
+
+    failed, copied = execute_moves(pairs, executor, workers, cancel)
+    return errors + failed, copied
+
+def report_errors(errors, action='moving', limit=20):
+    """Print the files that could not be processed"""
+    for path, message in errors[:limit]:
+        emit(f"Error {action} {path}: {message}", kind='error')
+    if len(errors) > limit:
+        emit(f"... and {len(errors) - limit} more errors.", kind='error')
+
+def plan_organize(directory, destination=None, recursive=False, max_depth=None, exclude=(),
+                  walkers=DEFAULT_WALKERS, classifier=None, paths=None):
+    """Work out the MovePlan organize_files_by_extension would carry out, without moving anything"""
+    roots = [directory] if isinstance(directory, (str, os.PathLike)) else list(directory)
+    classify = _resolve_classifier(classifier)
+    builder = PlanBuilder()
+    errors = []
+    targets = {}  # target folder -> names already there or claimed by the plan
+    if paths is not None:
+        files = _path_entries(roots[0], paths, errors, exclude)
+    else:
+        files = walk_files(roots, errors, recursive, max_depth, exclude, walkers,
+                            prune=[destination] if destination is not None else ())
+    try:
+        for root, entry, _ in files:
+            try:
+                folder = classify(entry)
+            except OSError as e:
+                errors.append((entry.path, str(e)))
+                continue
+            target_dir = os.path.join(destination if destination is not None else root, folder)
+            source_dir = os.path.dirname(entry.path)
+            if source_dir == target_dir:
+                continue  # already organized
+            names = targets.get(target_dir)
+            if names is None:
+                try:
+                    names = targets[target_dir] = set(os.listdir(target_dir))
+                except FileNotFoundError:
+                    names = targets[target_dir] = set()
+                    builder.create_dir(target_dir)
+            conflict = entry.name in names
+            names.add(entry.name)
+            builder.add(source_dir, entry.name, target_dir, conflict=conflict)
+    finally:
+        files.close()
+        if classify is not classifier and hasattr(classify, 'close'):
+            classify.close()
+    report_errors(errors, 'planning')
+    return builder.build()
+
+def _print_plan(plan, verb, limit=20):
+    """Print a dry-run summary of a MovePlan"""
+    summary = plan.summary()
+    shown = 0
+    for source, target, conflict in plan:
+        if shown >= limit:
+            break
+        if conflict:
+            emit(f"Conflict: {source} -> {target} (target exists)", kind='warning')
+        else:
+            emit(f"Would move: {source} -> {target}")
+        shown += 1
+    if len(plan) > limit:
+        emit(f"... and {len(plan) - limit} more.")
+    emit(f"📝 Dry run: {summary['moves']} files would be {verb}, "
+         f"{summary['conflicts']} conflicts, "
+         f"{summary['directories_to_create']} folders to create.")
+
+def organize_files_by_extension(directory, *,
+                                # Which files: the walk and what it skips
+                                recursive=False, max_depth=None, exclude=(), paths=None,
+                                walkers=DEFAULT_WALKERS, incremental=False, index_file=ORGANIZER_INDEX_FILE,
+                                # Where they go
+                                destination=None, classifier=None,
+                                # How they are moved
+                                streaming=False, batch_size=DEFAULT_BATCH_SIZE, workers=1,
+                                progress_callback=None, cancel=None,
+                                # Instead of or after moving
+                                dry_run=False, dedup=None):
+    """Organize files into one sub-folder per extension; returns the result, or the MovePlan on a dry run"""
+    try:
+        roots = [directory] if isinstance(directory, (str, os.PathLike)) else list(directory)
+        for root in roots:
+            if not os.path.exists(root):
+                emit(f"Error: Directory '{root}' does not exist.", kind='error')
+                return None
+        label = ", ".join(str(root) for root in roots)
+
+        if dry_run:
+            plan = plan_organize(roots, destination, recursive, max_depth, exclude, walkers,
+                                 classifier, paths)
+            _print_plan(plan, 'organized')
+            return plan
+
+        if not streaming:
+            batch_size = None
+        if destination is not None:
+            os.makedirs(destination, exist_ok=True)
+        classify = _resolve_classifier(classifier)
+        index = None
+        if incremental:
+            # The index stores absolute paths so that runs from anywhere agree
+            roots = [os.path.abspath(root) for root in roots]
+            if destination is not None:
+                destination = os.path.abspath(destination)
+            index = SnapshotIndex(index_file)
+
+        start = time.perf_counter()
+        created_dirs = {}
+        batch = defaultdict(list)
+        pending = 0
+        moved = 0
+        bytes_copied = 0
+        errors = []
+        seen = []
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        def flush():
+            nonlocal batch, pending, moved, bytes_copied, cancelled
+            failed, copied = _move_batch(batch, created_dirs, executor, workers, recursive, cancel)
+            not_started = {path for path, error in failed if error == "cancelled"}
+            if not_started:
+                cancelled = True
+                failed = [(path, error) for path, error in failed if error != "cancelled"]
+            errors.extend(failed)
+            bytes_copied += copied
+            moved += pending - len(failed) - len(not_started)
+            batch = defaultdict(list)
+            pending = 0
+            if index is not None:
+                # Remember each file where it ended up, so no later run looks at it again;
+                # files that failed or never started stay unknown and are retried
+                left = not_started.union(path for path, _ in failed)
+                index.record_entries([(target, size, mtime_ns)
+                                      for source, target, size, mtime_ns in seen
+                                      if source not in left])
+                seen.clear()
+            elapsed = time.perf_counter() - start
+            done = moved + len(errors)
+            rate = done / elapsed if elapsed > 0 else 0.0
+            events.progress(done, rate=rate)
+            if progress_callback:
+                progress_callback(done, rate)
+
+        if paths is not None:
+            files = _path_entries(roots[0], paths, errors, exclude)
+        else:
+            files = walk_files(roots, errors, recursive, max_depth, exclude, walkers,
+                                prune=[destination] if destination is not None else (), index=index)
+        cancelled = False
+        completed = False
+        try:
+            for root, entry, dev in files:
+                if cancel is not None and cancel.is_set():
+                    cancelled = True
+                    break
+                try:
+                    folder = classify(entry)
+                    st = entry.stat() if index is not None else None
+                except OSError as e:
+                    errors.append((entry.path, str(e)))
+                    continue
+                target_dir = os.path.join(destination if destination is not None else root, folder)
+                target = os.path.join(target_dir, entry.name)
+                if index is not None:
+                    seen.append((entry.path, target, st.st_size, st.st_mtime_ns))
+                if os.path.dirname(entry.path) == target_dir:
+                    continue  # already organized
+                batch[target_dir].append((entry.path, entry.name, dev))
+                pending += 1
+                if batch_size and pending >= batch_size:
+                    flush()
+
+            if (pending or seen) and not cancelled:
+                flush()
+            completed = not cancelled
+        finally:
+            files.close()
+            if executor:
+                executor.shutdown()
+            if classify is not classifier and hasattr(classify, 'close'):
+                classify.close()
+            if index is not None:
+                if completed:
+                    index.commit_dirs(skip={os.path.dirname(path) for path, _ in errors})
+                for path, (_, _, mtime_ns) in created_dirs.items():
+                    index.refresh_dir(path, mtime_ns)
+                index.close()
+
+        if index is not None and (index.dirs_skipped or index.files_skipped):
+            emit(f"⚡ Skipped {index.dirs_skipped} unchanged folders and "
+                 f"{index.files_skipped} known files.")
+
+        if cancelled:
+            emit(f"🛑 Organizing cancelled after {moved} files.", kind='warning')
+            events.result(moved=moved, bytes_copied=bytes_copied, errors=errors, cancelled=True)
+            return {'moved': moved, 'bytes_copied': bytes_copied, 'errors': errors, 'cancelled': True}
+
+        if not moved and not errors:
+            emit(f"No {'new ' if incremental else ''}files found in directory '{label}'.")
+            events.result(moved=0, bytes_copied=0, errors=[])
+            return {'moved': 0, 'bytes_copied': 0, 'errors': []}
+
+        elapsed = time.perf_counter() - start
+        report_errors(errors)
+        emit(f"Organized {moved} files in {label} by extension.")
+        if bytes_copied:
+            rate = bytes_copied / elapsed / (1024**2) if elapsed > 0 else 0.0
+            emit(f"Copied {bytes_copied / (1024**2):.1f} MB across filesystems at {rate:.1f} MB/s.")
+        if errors:
+            emit(f"⚠️ {len(errors)} files could not be moved.", kind='warning')
+        if dedup:
+            # Imported here: duplicate_finder builds on this module
+            from duplicate_finder import find_duplicates
+            find_duplicates(destination if destination is not None else roots, action=dedup)
+        events.result(moved=moved, bytes_copied=bytes_copied, errors=errors)
+        return {'moved': moved, 'bytes_copied': bytes_copied, 'errors': errors}
     except Exception as e:
-        print(f"Error organizing files: {e}")
+        emit(f"Error organizing files: {e}", kind='error')
+        return None
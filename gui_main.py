@@ -4,12 +4,26 @@ Modern graphical interface using tkinter
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import threading
+import queue
+import time
 import os
 import file_organizer
 import batch_renamer
 import time_tracker
 import system_monitor
+import alerts
+import tasks
+
+# Sessions fetched at a time into the rename history list
+HISTORY_PAGE_SIZE = 100
+# How often queued task output is written to the widgets
+UI_PUMP_INTERVAL_MS = 50
+# Longest the pump may spend draining the queue in one tick (seconds)
+UI_PUMP_BUDGET = 0.02
+# Lines kept in each output box; older lines are dropped
+MAX_OUTPUT_LINES = 5000
+# How often the System Monitor tab re-reads the sampler when auto-refreshing
+STATS_REFRESH_MS = 1000
 
 class AutomationSuiteGUI:
     def __init__(self, root):
@@ -27,7 +41,24 @@ class AutomationSuiteGUI:
         self.timer = None
         self.timer_running = False
         
+        # Events from worker threads, drained by pump_ui_queue on the Tk thread
+        self.ui_queue = queue.SimpleQueue()
+        
+        # Background jobs: bounded pool, cancellable, reported in the Tasks tab
+        self.task_manager = tasks.TaskManager(
+            on_change=lambda task: self.ui_queue.put((None, self.refresh_tasks_panel)))
+        self.tasks_tick_scheduled = False
+        self.sampler = system_monitor.sampler()
+        self.alert_engine = alerts.AlertEngine(sinks=[
+            alerts.LogFileSink(),
+            alerts.DesktopNotificationSink(),
+            lambda alert: self.ui_queue.put((None, lambda: self.status_var.set(alert['message']))),
+        ]).attach(self.sampler)
+        self.auto_refresh_scheduled = False
+        
         self.create_widgets()
+        self.root.after(UI_PUMP_INTERVAL_MS, self.pump_ui_queue)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def configure_styles(self):
         # Configure custom styles
@@ -57,6 +88,14 @@ class AutomationSuiteGUI:
                               relief=tk.SUNKEN, anchor=tk.W)
         status_bar.pack(side=tk.BOTTOM, fill=tk.X, pady=(0, 5))
         
+        # Progress of the running task: bar plus count, rate and ETA
+        progress_frame = ttk.Frame(self.root)
+        progress_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20)
+        self.progress_bar = ttk.Progressbar(progress_frame, length=250)
+        self.progress_bar.pack(side='left')
+        self.progress_var = tk.StringVar()
+        ttk.Label(progress_frame, textvariable=self.progress_var).pack(side='left', padx=10)
+        
         # Create notebook for tabs
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=20, pady=10)
@@ -66,6 +105,7 @@ class AutomationSuiteGUI:
         self.create_batch_renamer_tab()
         self.create_time_tracker_tab()
         self.create_system_monitor_tab()
+        self.create_tasks_tab()
         
     def create_file_organizer_tab(self):
         # File Organizer Tab
@@ -123,10 +163,27 @@ class AutomationSuiteGUI:
         prefix_frame = ttk.Frame(rename_frame)
         prefix_frame.pack(pady=5, fill='x')
         
-        ttk.Label(prefix_frame, text="Prefix for renamed files:").pack(side='left')
+        ttk.Label(prefix_frame, text="Prefix or template ({name}, {n}, {date}...):").pack(side='left')
         self.prefix_var = tk.StringVar(value="file")
         ttk.Entry(prefix_frame, textvariable=self.prefix_var, width=15).pack(side='right')
         
+        # Optional regex for template capture groups
+        pattern_frame = ttk.Frame(rename_frame)
+        pattern_frame.pack(pady=5, fill='x')
+        
+        ttk.Label(pattern_frame, text="Regex pattern (optional):").pack(side='left')
+        self.pattern_var = tk.StringVar()
+        ttk.Entry(pattern_frame, textvariable=self.pattern_var, width=15).pack(side='right')
+        
+        # Order the files are numbered in
+        sort_frame = ttk.Frame(rename_frame)
+        sort_frame.pack(pady=5, fill='x')
+        
+        ttk.Label(sort_frame, text="Number files by:").pack(side='left')
+        self.sort_var = tk.StringVar(value='natural')
+        ttk.Combobox(sort_frame, textvariable=self.sort_var, values=batch_renamer.SORT_ORDERS,
+                     state='readonly', width=12).pack(side='right')
+        
         ttk.Button(rename_frame, text="🏷️ Rename Files", 
                   style='Custom.TButton',
                   command=self.rename_files).pack(pady=10)
@@ -154,9 +211,12 @@ class AutomationSuiteGUI:
         history_frame = ttk.Frame(undo_frame)
         history_frame.pack(fill='both', expand=True)
         
+        self.history_ids = []
+        self.history_total = 0
         self.history_listbox = tk.Listbox(history_frame, height=4, font=('Courier', 8))
         history_scrollbar = ttk.Scrollbar(history_frame, orient='vertical', command=self.history_listbox.yview)
-        self.history_listbox.configure(yscrollcommand=history_scrollbar.set)
+        self.history_listbox.configure(yscrollcommand=lambda first, last: self.on_history_scroll(
+            history_scrollbar, first, last))
         
         self.history_listbox.pack(side='left', fill='both', expand=True)
         history_scrollbar.pack(side='right', fill='y')
@@ -175,6 +235,7 @@ class AutomationSuiteGUI:
         
         # Load initial history
         self.refresh_rename_history()
+        self.root.after(500, self.check_interrupted_renames)
         
     def create_time_tracker_tab(self):
         # Time Tracker Tab
@@ -233,13 +294,177 @@ class AutomationSuiteGUI:
         
         # Auto-refresh checkbox
         self.auto_refresh_var = tk.BooleanVar()
-        ttk.Checkbutton(monitor_frame, text="Auto-refresh every 5 seconds", 
+        ttk.Checkbutton(monitor_frame, text="Auto-refresh every second", 
                        variable=self.auto_refresh_var,
                        command=self.toggle_auto_refresh).pack(pady=10)
         
         # Load initial stats after the interface is ready
         self.root.after(100, self.refresh_system_stats)
         
+    def append_output(self, output, lines):
+        """Add lines to an output box in one insert, keeping only its last MAX_OUTPUT_LINES"""
+        lines = lines[-MAX_OUTPUT_LINES:]
+        output.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(output.index('end-1c').split('.')[0])
+        if line_count > MAX_OUTPUT_LINES:
+            output.delete('1.0', f'{line_count - MAX_OUTPUT_LINES}.0')
+        output.see(tk.END)
+        
+    def show_progress(self, data, name=None):
+        """Update the progress bar from a progress event's data (None clears it)"""
+        if data is None:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate', value=0)
+            self.progress_var.set("")
+            return
+        done, total, rate = data['done'], data.get('total'), data.get('rate')
+        text = f"{name}: {done:,}" if name else f"{done:,}"
+        if total:
+            self.progress_bar.config(mode='determinate', maximum=total, value=done)
+            text += f" / {total:,}"
+        else:
+            # Unknown total: keep the bar moving to show activity
+            self.progress_bar.config(mode='indeterminate')
+            self.progress_bar.step(5)
+        if rate:
+            text += f"  ·  {rate:,.0f}/s"
+            if total and done < total:
+                minutes, seconds = divmod(int((total - done) / rate), 60)
+                text += f"  ·  ETA {minutes}m {seconds:02d}s"
+        self.progress_var.set(text)
+        
+    def update_progress(self):
+        """Show the progress of the selected running task, else of the newest one running"""
+        running = [task for task in self.task_manager.tasks() if task.state == 'running']
+        selected = {int(item) for item in self.tasks_tree.selection()}
+        task = next((task for task in running if task.id in selected), running[-1] if running else None)
+        if task is None:
+            self.show_progress(None)
+        else:
+            self.show_progress(task.progress, task.name)
+        
+    def pump_ui_queue(self):
+        """Write queued task output to the widgets, a frame's worth at a time.
+        
+        Runs every UI_PUMP_INTERVAL_MS on the Tk thread. Messages are grouped
+        into one insert per output box, progress is redrawn once per tick,
+        and draining stops after UI_PUMP_BUDGET so a flood of events can
+        never freeze the window; the rest waits for the next tick.
+        """
+        deadline = time.perf_counter() + UI_PUMP_BUDGET
+        lines = {}
+        progressed = False
+        callbacks = []
+        while time.perf_counter() < deadline:
+            try:
+                output, item = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if output is None:
+                callbacks.append(item)
+            elif item.kind == 'progress':
+                progressed = True
+            elif item.message:
+                lines.setdefault(output, []).append(item.message)
+        
+        for output, text in lines.items():
+            self.append_output(output, text)
+        if progressed:
+            self.update_progress()
+        for callback in callbacks:
+            callback()
+        self.root.after(UI_PUMP_INTERVAL_MS, self.pump_ui_queue)
+        
+    def run_task(self, name, work, output, on_done=None, error_status="Error occurred"):
+        """Queue work(cancel_event) on the task manager, streaming its events into an output box.
+        
+        Events are routed per thread (see events.listen) into the UI queue,
+        so tasks running side by side never mix their output and lines show
+        up within one pump tick of being emitted. When the task finishes,
+        on_done(result) runs on the Tk thread after everything it emitted
+        has been shown; a failure is written to the output box instead.
+        """
+        def finished(task):
+            self.ui_queue.put((None, lambda: self.task_finished(task, output, on_done, error_status)))
+            
+        return self.task_manager.submit(name, work, on_done=finished,
+                                        listener=lambda event: self.ui_queue.put((output, event)))
+        
+    def task_finished(self, task, output, on_done, error_status):
+        self.update_progress()
+        if task.state == 'failed':
+            self.append_output(output, [f"Error: {task.error}"])
+            self.status_var.set(error_status)
+            return
+        if task.started is not None and on_done:
+            on_done(task.result)
+        if task.state == 'cancelled':
+            self.status_var.set(f"🛑 {task.name} cancelled")
+        
+    def create_tasks_tab(self):
+        # Tasks Tab
+        tasks_frame = ttk.Frame(self.notebook)
+        self.notebook.add(tasks_frame, text="🧵 Tasks")
+        
+        ttk.Label(tasks_frame, text="Background Tasks", 
+                 style='Header.TLabel').pack(pady=10)
+        
+        self.tasks_tree = ttk.Treeview(tasks_frame, columns=('task', 'state', 'time'),
+                                       show='headings', height=12)
+        self.tasks_tree.heading('task', text='Task')
+        self.tasks_tree.heading('state', text='State')
+        self.tasks_tree.heading('time', text='Time')
+        self.tasks_tree.column('state', width=100, anchor='center')
+        self.tasks_tree.column('time', width=80, anchor='e')
+        self.tasks_tree.pack(pady=10, padx=20, fill='both', expand=True)
+        self.tasks_tree.bind('<<TreeviewSelect>>', lambda event: self.update_progress())
+        
+        button_frame = ttk.Frame(tasks_frame)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="🛑 Cancel Selected", 
+                  style='Custom.TButton',
+                  command=self.cancel_selected_task).pack(side='left', padx=10)
+        ttk.Button(button_frame, text="🛑 Cancel All", 
+                  style='Custom.TButton',
+                  command=self.task_manager.cancel_all).pack(side='left', padx=10)
+        
+    def refresh_tasks_panel(self):
+        """Show every running, queued and recently finished task"""
+        selection = self.tasks_tree.selection()
+        self.tasks_tree.delete(*self.tasks_tree.get_children())
+        any_running = False
+        for task in reversed(self.task_manager.tasks()):
+            state = task.state
+            if state == 'running' and task.cancel_event.is_set():
+                state = 'cancelling'
+            self.tasks_tree.insert('', tk.END, iid=str(task.id),
+                                   values=(task.name, state, f"{task.elapsed:.1f}s"))
+            any_running = any_running or task.state == 'running'
+        self.tasks_tree.selection_set([item for item in selection if self.tasks_tree.exists(item)])
+        # Keep the elapsed times ticking while something runs
+        if any_running and not self.tasks_tick_scheduled:
+            self.tasks_tick_scheduled = True
+            self.root.after(1000, self.tick_tasks_panel)
+            
+    def tick_tasks_panel(self):
+        self.tasks_tick_scheduled = False
+        self.refresh_tasks_panel()
+        
+    def cancel_selected_task(self):
+        selection = self.tasks_tree.selection()
+        if not selection:
+            messagebox.showwarning("No Selection", "Please select a task to cancel.")
+            return
+        for item in selection:
+            self.task_manager.cancel(int(item))
+        self.refresh_tasks_panel()
+        
+    def on_close(self):
+        """Ask running tasks to stop, then close the window"""
+        self.task_manager.shutdown()
+        self.sampler.stop()
+        self.root.destroy()
+        
     def browse_organize_directory(self):
         directory = filedialog.askdirectory()
         if directory:
@@ -259,31 +484,19 @@ class AutomationSuiteGUI:
         self.org_output.delete(1.0, tk.END)
         self.status_var.set("Organizing files...")
         
-        def organize_thread():
-            try:
-                # Capture output
-                import io
-                import sys
-                old_stdout = sys.stdout
-                sys.stdout = captured_output = io.StringIO()
-                
-                file_organizer.organize_files_by_extension(directory)
-                
-                sys.stdout = old_stdout
-                output = captured_output.getvalue()
-                
-                self.root.after(0, lambda: self.org_output.insert(tk.END, output))
-                self.root.after(0, lambda: self.status_var.set("Files organized successfully!"))
-                
-            except Exception as e:
-                self.root.after(0, lambda: self.org_output.insert(tk.END, f"Error: {str(e)}"))
-                self.root.after(0, lambda: self.status_var.set("Error occurred"))
-                
-        threading.Thread(target=organize_thread, daemon=True).start()
+        self.run_task("Organize files",
+                      lambda cancel: file_organizer.organize_files_by_extension(directory, cancel=cancel),
+                      self.org_output,
+                      lambda result: self.status_var.set("Files organized successfully!" if result is not None
+                                                         else "Error occurred"))
         
     def rename_files(self):
         directory = self.rename_dir_var.get()
         prefix = self.prefix_var.get()
+        pattern = self.pattern_var.get() or None
+        # Anything with a {field} is a rename template rather than a plain prefix
+        template = prefix if '{' in prefix else None
+        sort = self.sort_var.get()
         
         if not directory:
             messagebox.showerror("Error", "Please select a directory first!")
@@ -295,59 +508,31 @@ class AutomationSuiteGUI:
         self.rename_output.delete(1.0, tk.END)
         self.status_var.set("Renaming files...")
         
-        def rename_thread():
-            try:
-                import io
-                import sys
-                old_stdout = sys.stdout
-                sys.stdout = captured_output = io.StringIO()
-                
-                batch_renamer.batch_rename(directory, prefix)
-                
-                sys.stdout = old_stdout
-                output = captured_output.getvalue()
-                
-                self.root.after(0, lambda: self.rename_output.insert(tk.END, output))
-                self.root.after(0, lambda: self.status_var.set("Files renamed successfully!"))
-                
-            except Exception as e:
-                self.root.after(0, lambda: self.rename_output.insert(tk.END, f"Error: {str(e)}"))
-                self.root.after(0, lambda: self.status_var.set("Error occurred"))
-                
-        threading.Thread(target=rename_thread, daemon=True).start()
-        
-        # Refresh history after rename
-        self.root.after(2000, self.refresh_rename_history)
+        def on_done(result):
+            self.status_var.set("Files renamed successfully!" if result else "No files were renamed")
+            self.refresh_rename_history()
+            
+        self.run_task("Rename files",
+                      lambda cancel: batch_renamer.batch_rename(directory, prefix, template=template,
+                                                                pattern=pattern, sort=sort,
+                                                                cancel=cancel),
+                      self.rename_output, on_done)
         
     def undo_last_rename(self):
         """Undo the most recent rename operation"""
         self.rename_output.delete(1.0, tk.END)
         self.status_var.set("Undoing last rename...")
         
-        def undo_thread():
-            try:
-                import io
-                import sys
-                old_stdout = sys.stdout
-                sys.stdout = captured_output = io.StringIO()
-                
-                success = batch_renamer.undo_last_rename()
-                
-                sys.stdout = old_stdout
-                output = captured_output.getvalue()
-                
-                self.root.after(0, lambda: self.rename_output.insert(tk.END, output))
-                if success:
-                    self.root.after(0, lambda: self.status_var.set("Undo completed successfully!"))
-                    self.root.after(100, self.refresh_rename_history)
-                else:
-                    self.root.after(0, lambda: self.status_var.set("Undo failed or nothing to undo"))
-                
-            except Exception as e:
-                self.root.after(0, lambda: self.rename_output.insert(tk.END, f"Error: {str(e)}"))
-                self.root.after(0, lambda: self.status_var.set("Error during undo"))
+        def on_done(success):
+            if success:
+                self.status_var.set("Undo completed successfully!")
+                self.refresh_rename_history()
+            else:
+                self.status_var.set("Undo failed or nothing to undo")
                 
-        threading.Thread(target=undo_thread, daemon=True).start()
+        self.run_task("Undo last rename", lambda cancel: batch_renamer.undo_last_rename(cancel=cancel),
+                      self.rename_output, on_done,
+                      error_status="Error during undo")
         
     def undo_selected_session(self, event):
         """Undo a selected session from the history list"""
@@ -356,7 +541,11 @@ class AutomationSuiteGUI:
             messagebox.showwarning("No Selection", "Please select a session to undo.")
             return
         
-        session_index = len(batch_renamer.rename_history) - 1 - selection[0]  # Reverse index
+        if selection[0] >= len(self.history_ids):
+            return
+        # The id stays valid while the task waits; the index is only for display
+        session_id = self.history_ids[selection[0]]
+        session_index = batch_renamer.rename_history.index_of(session_id)
         
         # Confirm undo
         if messagebox.askyesno("Confirm Undo", 
@@ -366,56 +555,26 @@ class AutomationSuiteGUI:
             self.rename_output.delete(1.0, tk.END)
             self.status_var.set(f"Undoing session #{session_index}...")
             
-            def undo_thread():
-                try:
-                    import io
-                    import sys
-                    old_stdout = sys.stdout
-                    sys.stdout = captured_output = io.StringIO()
-                    
-                    success = batch_renamer.undo_rename_session(session_index)
-                    
-                    sys.stdout = old_stdout
-                    output = captured_output.getvalue()
-                    
-                    self.root.after(0, lambda: self.rename_output.insert(tk.END, output))
-                    if success:
-                        self.root.after(0, lambda: self.status_var.set("Session undo completed!"))
-                        self.root.after(100, self.refresh_rename_history)
-                    else:
-                        self.root.after(0, lambda: self.status_var.set("Session undo failed"))
-                    
-                except Exception as e:
-                    self.root.after(0, lambda: self.rename_output.insert(tk.END, f"Error: {str(e)}"))
-                    self.root.after(0, lambda: self.status_var.set("Error during undo"))
+            def on_done(success):
+                if success:
+                    self.status_var.set("Session undo completed!")
+                    self.refresh_rename_history()
+                else:
+                    self.status_var.set("Session undo failed")
                     
-            threading.Thread(target=undo_thread, daemon=True).start()
+            self.run_task(f"Undo session #{session_index}",
+                          lambda cancel: batch_renamer.undo_rename_session_by_id(session_id, cancel=cancel),
+                          self.rename_output, on_done, error_status="Error during undo")
         
     def show_rename_history(self):
         """Show detailed rename history in the output"""
         self.rename_output.delete(1.0, tk.END)
         self.status_var.set("Loading rename history...")
         
-        def history_thread():
-            try:
-                import io
-                import sys
-                old_stdout = sys.stdout
-                sys.stdout = captured_output = io.StringIO()
-                
-                batch_renamer.list_rename_history()
-                
-                sys.stdout = old_stdout
-                output = captured_output.getvalue()
-                
-                self.root.after(0, lambda: self.rename_output.insert(tk.END, output))
-                self.root.after(0, lambda: self.status_var.set("History loaded"))
-                
-            except Exception as e:
-                self.root.after(0, lambda: self.rename_output.insert(tk.END, f"Error: {str(e)}"))
-                self.root.after(0, lambda: self.status_var.set("Error loading history"))
-                
-        threading.Thread(target=history_thread, daemon=True).start()
+        self.run_task("Rename history", lambda cancel: batch_renamer.list_rename_history(),
+                      self.rename_output,
+                      lambda result: self.status_var.set("History loaded"),
+                      error_status="Error loading history")
         
     def clear_rename_history(self):
         """Clear all rename history after confirmation"""
@@ -429,25 +588,60 @@ class AutomationSuiteGUI:
             self.rename_output.insert(tk.END, "✅ Rename history cleared.\n")
             self.status_var.set("History cleared")
             
+    def check_interrupted_renames(self):
+        """Offer to resume or roll back batch renames a crash left unfinished"""
+        for session in batch_renamer.interrupted_sessions():
+            answer = messagebox.askyesnocancel(
+                "Interrupted Rename",
+                f"A batch rename in {session['directory']} was interrupted "
+                f"({len(session['operations'])} files).\n\n"
+                "Yes: resume it\nNo: roll it back\nCancel: decide later")
+            if answer is None:
+                continue
+            action = 'resume' if answer else 'rollback'
+            
+            self.status_var.set(f"Recovering interrupted rename ({action})...")
+            
+            def on_done(result):
+                self.status_var.set("Interrupted rename recovered")
+                self.refresh_rename_history()
+                
+            self.run_task(f"Recover rename ({action})",
+                          lambda cancel, session=session, action=action:
+                              batch_renamer.recover_interrupted_rename(session, action),
+                          self.rename_output, on_done, error_status="Error recovering rename")
+            
     def refresh_rename_history(self):
-        """Refresh the history listbox with current sessions"""
+        """Reload the history listbox from its first page"""
         self.history_listbox.delete(0, tk.END)
+        self.history_ids = []
+        self.history_total = 0
         
-        # Load current history
+        # Drop the open journal connection so changes from other processes show up
         batch_renamer.load_rename_history()
+        self.load_history_page()
         
-        if not batch_renamer.rename_history:
+        if not self.history_ids:
             self.history_listbox.insert(0, "No history")
-            return
-        
-        # Show most recent sessions first
-        for i, session in enumerate(reversed(batch_renamer.rename_history)):
+            
+    def load_history_page(self):
+        """Append the next page of sessions (most recent first) to the listbox"""
+        sessions, self.history_total = batch_renamer.query_rename_history(
+            offset=len(self.history_ids), limit=HISTORY_PAGE_SIZE)
+        for session in sessions:
             timestamp = session['timestamp'][:19].replace('T', ' ')  # Format timestamp
             prefix = session['prefix']
-            num_ops = len(session['operations'])
+            num_ops = session['count']
             
             entry = f"{timestamp} | {prefix} ({num_ops} files)"
             self.history_listbox.insert(tk.END, entry)
+            self.history_ids.append(session['id'])
+            
+    def on_history_scroll(self, scrollbar, first, last):
+        """Fetch more history once the listbox is scrolled near its end"""
+        scrollbar.set(first, last)
+        if float(last) > 0.9 and len(self.history_ids) < self.history_total:
+            self.root.after_idle(self.load_history_page)
         
     def start_timer(self):
         if not self.timer_running:
@@ -493,38 +687,30 @@ class AutomationSuiteGUI:
         if not hasattr(self, 'status_var'):
             return
             
+        # The sampler measures in the background; reading its snapshot is instant
+        stats = self.sampler.latest(timeout=0)
+        if stats is None:
+            self.status_var.set("Measuring system stats...")
+            self.root.after(100, self.refresh_system_stats)
+            return
+            
         self.stats_text.delete(1.0, tk.END)
-        self.status_var.set("Refreshing system stats...")
-        
-        def stats_thread():
-            try:
-                import io
-                import sys
-                old_stdout = sys.stdout
-                sys.stdout = captured_output = io.StringIO()
-                
-                system_monitor.show_system_stats()
-                
-                sys.stdout = old_stdout
-                output = captured_output.getvalue()
-                
-                self.root.after(0, lambda: self.stats_text.insert(tk.END, output))
-                self.root.after(0, lambda: self.status_var.set("System stats refreshed"))
-                
-            except Exception as e:
-                self.root.after(0, lambda: self.stats_text.insert(tk.END, f"Error: {str(e)}"))
-                self.root.after(0, lambda: self.status_var.set("Error getting stats"))
-                
-        threading.Thread(target=stats_thread, daemon=True).start()
+        self.append_output(self.stats_text, system_monitor.format_stats(stats)
+                           + system_monitor.format_history(self.sampler.history)
+                           + ["", "Top processes by CPU:"]
+                           + system_monitor.format_processes(self.sampler.processes.top()))
+        self.status_var.set("System stats refreshed")
         
     def toggle_auto_refresh(self):
-        if self.auto_refresh_var.get():
+        if self.auto_refresh_var.get() and not self.auto_refresh_scheduled:
             self.auto_refresh_stats()
         
     def auto_refresh_stats(self):
+        self.auto_refresh_scheduled = False
         if self.auto_refresh_var.get():
             self.refresh_system_stats()
-            self.root.after(5000, self.auto_refresh_stats)
+            self.auto_refresh_scheduled = True
+            self.root.after(STATS_REFRESH_MS, self.auto_refresh_stats)
 
 def main():
     root = tk.Tk()
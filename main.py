@@ -4,6 +4,7 @@ Main entry point for Python Automation Suite
 import sys
 import os
 import file_organizer
+import directory_watcher
 import batch_renamer
 import time_tracker
 import system_monitor
@@ -18,6 +19,7 @@ def print_menu():
     print("5. ⏱️ Time tracking utilities")
     print("6. 📊 System monitoring")
     print("7. 🖥️ Launch GUI Version")
+    print("8. 👀 Watch directory (auto-organize)")
     print("0. ❌ Exit")
     print("=" * 40)
 
@@ -48,8 +50,20 @@ def main():
         except ImportError:
             run_cli()
 
+def recover_interrupted_renames():
+    """Offer to resume or roll back batch renames a crash left unfinished"""
+    for session in batch_renamer.interrupted_sessions():
+        print(f"\n⚠️ A batch rename in {session['directory']} was interrupted "
+              f"({len(session['operations'])} files, started {session['timestamp'][:19]}).")
+        choice = input("❓ Resume it (r), roll it back (b) or decide later (Enter)? ").strip().lower()
+        if choice == 'r':
+            batch_renamer.recover_interrupted_rename(session, 'resume')
+        elif choice == 'b':
+            batch_renamer.recover_interrupted_rename(session, 'rollback')
+
 def run_cli():
     """Run the command line interface"""
+    recover_interrupted_renames()
     while True:
         print_menu()
         choice = input("\nSelect an option: ").strip()
@@ -63,9 +77,17 @@ def run_cli():
                 
         elif choice == '2':
             directory = input("📁 Enter directory to rename files: ").strip()
-            prefix = input("🏷️ Enter prefix for files: ").strip()
+            prefix = input("🏷️ Enter prefix for files (or a template like {name|lower}_{n}{ext}): ").strip()
+            template = pattern = None
+            if '{' in prefix:
+                template = prefix
+                pattern = input("🔍 Regex to capture {1}, {2}... from (press Enter for none): ").strip() or None
+            sort = input("🔢 Number files by (natural/name/mtime/size/ext, press Enter for natural): ").strip().lower()
+            if sort not in batch_renamer.SORT_ORDERS:
+                sort = 'natural'
             if directory and prefix:
-                success = batch_renamer.batch_rename(directory, prefix)
+                success = batch_renamer.batch_rename(directory, prefix, template=template, pattern=pattern,
+                                                     sort=sort)
                 if success:
                     undo_choice = input("\n❓ Would you like to undo this operation? (y/n): ").strip().lower()
                     if undo_choice == 'y':
@@ -78,16 +100,27 @@ def run_cli():
             batch_renamer.undo_last_rename()
             
         elif choice == '4':
-            print("📋 Rename History:")
-            batch_renamer.list_rename_history()
-            if batch_renamer.rename_history:
-                undo_choice = input("\n❓ Enter session number to undo (or press Enter to skip): ").strip()
-                if undo_choice.isdigit():
+            page = 0
+            while True:
+                sessions = batch_renamer.list_rename_history(page)
+                if not sessions:
+                    break
+                undo_choice = input("\n❓ Enter session number to undo, n/p for next/previous page "
+                                    "(or press Enter to skip): ").strip().lower()
+                if undo_choice == 'n':
+                    pages = -(-batch_renamer.rename_history.count() // batch_renamer.HISTORY_PAGE_SIZE)
+                    page = max(min(page + 1, pages - 1), 0)
+                elif undo_choice == 'p':
+                    page = max(page - 1, 0)
+                elif undo_choice.isdigit():
                     session_num = int(undo_choice)
                     if 0 <= session_num < len(batch_renamer.rename_history):
                         batch_renamer.undo_rename_session(session_num)
                     else:
                         print("❌ Invalid session number!")
+                    break
+                else:
+                    break
                         
         elif choice == '5':
             tracker = time_tracker.TimeTracker()
@@ -99,6 +132,8 @@ def run_cli():
             print("📊 System Statistics:")
             print("-" * 30)
             system_monitor.show_system_stats()
+            print(f"\n🔝 Top {system_monitor.DEFAULT_TOP_PROCESSES} processes by CPU:")
+            system_monitor.show_top_processes()
             
         elif choice == '7':
             try:
@@ -109,6 +144,13 @@ def run_cli():
             except ImportError as e:
                 print(f"❌ Error launching GUI: {e}")
                 
+        elif choice == '8':
+            directory = input("📁 Enter directory to watch: ").strip()
+            if directory:
+                directory_watcher.watch_directory(directory)
+            else:
+                print("❌ No directory specified!")
+                
         elif choice == '0':
             print("👋 Goodbye!")
             sys.exit(0)
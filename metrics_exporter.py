@@ -0,0 +1,164 @@
+"""
+Headless Metrics Exporter
+
+Serves the system monitor's samples over HTTP in the Prometheus text
+format, for hosts without a display:
+
+    python metrics_exporter.py [--host 0.0.0.0] [--port 9120] [--interval 1]
+                               [--alert-log alerts.log] [--webhook URL] [--notify] [--no-alerts]
+
+Each sample is rendered once, on the sampler thread, into a complete
+HTTP response; a scrape of /metrics only writes those bytes out, so
+scrapes never call psutil and cost the same however often they come.
+The default alert rules (see alerts.py) run alongside.
+"""
+import argparse
+import asyncio
+
+import alerts
+import system_monitor
+from events import emit
+
+# Address and port the exporter listens on by default
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 9120
+# Seconds a client may take to send its request before it is dropped
+REQUEST_TIMEOUT = 5.0
+# Processes exported as system_process_* series
+EXPORTED_PROCESSES = 10
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+def render_metrics(stats, processes=()):
+    """A snapshot (and top processes) as Prometheus text exposition format"""
+    families = []
+
+    def family(name, help_text, samples):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f"{name}{_labels(**labels)} {float(value)!r}" for labels, value in samples]
+        families.append("\n".join(lines))
+
+    mounts = [mount for mount in stats['mounts'] if 'error' not in mount]
+    family('system_sample_timestamp_seconds', "When the sample was taken (Unix time).",
+           [({}, stats['timestamp'])])
+    family('system_cpu_usage_percent', "CPU busy share across all cores since the previous sample.",
+           [({}, stats['cpu_percent'])])
+    family('system_cpu_core_usage_percent', "CPU busy share per core since the previous sample.",
+           [({'core': core}, percent) for core, percent in enumerate(stats['cpu_per_core'])])
+    family('system_memory_usage_percent', "Memory in use.", [({}, stats['memory_percent'])])
+    family('system_memory_available_bytes', "Memory available to new processes.",
+           [({}, stats['memory_available'])])
+    family('system_filesystem_responding', "1 if the mount answered within the sampler's timeout.",
+           [({'mountpoint': mount['mountpoint'], 'device': mount['device'], 'fstype': mount['fstype']},
+             'error' not in mount) for mount in stats['mounts']])
+    family('system_filesystem_usage_percent', "Share of the file system in use.",
+           [({'mountpoint': mount['mountpoint']}, mount['percent']) for mount in mounts])
+    family('system_filesystem_free_bytes', "Free space on the file system.",
+           [({'mountpoint': mount['mountpoint']}, mount['free']) for mount in mounts])
+    family('system_filesystem_size_bytes', "Size of the file system.",
+           [({'mountpoint': mount['mountpoint']}, mount['total']) for mount in mounts])
+    family('system_disk_read_bytes_per_second', "Disk read rate since the previous sample.",
+           [({'disk': disk}, rates['read_rate']) for disk, rates in stats['disk_io'].items()])
+    family('system_disk_write_bytes_per_second', "Disk write rate since the previous sample.",
+           [({'disk': disk}, rates['write_rate']) for disk, rates in stats['disk_io'].items()])
+    family('system_network_sent_bytes_per_second', "Network send rate since the previous sample.",
+           [({'interface': nic}, rates['sent_rate']) for nic, rates in stats['net_io'].items()])
+    family('system_network_received_bytes_per_second', "Network receive rate since the previous sample.",
+           [({'interface': nic}, rates['recv_rate']) for nic, rates in stats['net_io'].items()])
+    family('system_process_cpu_usage_percent', "CPU use of the busiest processes (100 is one core).",
+           [({'pid': row['pid'], 'name': row['name']}, row['cpu_percent']) for row in processes])
+    family('system_process_resident_memory_bytes', "Resident memory of the busiest processes.",
+           [({'pid': row['pid'], 'name': row['name']}, row['memory_rss']) for row in processes])
+    return "\n".join(families) + "\n"
+
+def _response(status, body, content_type='text/plain; charset=utf-8'):
+    body = body.encode('utf-8') if isinstance(body, str) else body
+    head = (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+    return head.encode('ascii') + body
+
+class MetricsExporter:
+    """Prometheus endpoint over a SystemSampler's latest sample.
+
+    update() renders a sample into the response served at /metrics; it is
+    registered as a sampler listener, so it runs once per sample on the
+    sampler thread. serve() runs the asyncio HTTP server.
+    """
+
+    def __init__(self, sampler, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.sampler = sampler
+        self.host = host
+        self.port = port
+        self._metrics = _response("503 Service Unavailable", "no sample yet\n")
+        self._not_found = _response("404 Not Found", "try /metrics\n")
+        self._bad_request = _response("400 Bad Request", "bad request\n")
+
+    def update(self, stats):
+        processes = self.sampler.processes.top(EXPORTED_PROCESSES)
+        self._metrics = _response("200 OK", render_metrics(stats, processes), CONTENT_TYPE)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_TIMEOUT)
+            method, path = (request.split(b' ', 2) + [b'', b''])[:2]
+            if method not in (b'GET', b'HEAD'):
+                response = self._bad_request
+            elif path.split(b'?', 1)[0] in (b'/metrics', b'/'):
+                response = self._metrics
+            else:
+                response = self._not_found
+            if method == b'HEAD':
+                response = response[:response.index(b'\r\n\r\n') + 4]
+            writer.write(response)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.sampler.add_listener(self.update)
+        latest = self.sampler.latest(timeout=0)
+        if latest is not None:
+            self.update(latest)
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        emit(f"📡 Serving metrics on http://{self.host}:{self.port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve system metrics in Prometheus format")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument('--interval', type=float, default=system_monitor.DEFAULT_SAMPLE_INTERVAL,
+                        help="seconds between samples")
+    parser.add_argument('--alert-log', default=alerts.ALERT_LOG_FILE, help="file alerts are appended to")
+    parser.add_argument('--webhook', help="URL alerts are POSTed to as JSON")
+    parser.add_argument('--notify', action='store_true', help="show alerts as desktop notifications")
+    parser.add_argument('--no-alerts', action='store_true', help="do not evaluate alert rules")
+    args = parser.parse_args()
+
+    sampler = system_monitor.sampler(args.interval)
+    if not args.no_alerts:
+        sinks = [alerts.emit_alert, alerts.LogFileSink(args.alert_log)]
+        if args.webhook:
+            sinks.append(alerts.WebhookSink(args.webhook))
+        if args.notify:
+            sinks.append(alerts.DesktopNotificationSink())
+        alerts.AlertEngine(sinks=sinks).attach(sampler)
+    exporter = MetricsExporter(sampler, args.host, args.port)
+    try:
+        asyncio.run(exporter.serve())
+    except KeyboardInterrupt:
+        emit("👋 Exporter stopped")
+
+if __name__ == "__main__":
+    main()
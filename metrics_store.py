@@ -0,0 +1,169 @@
+"""
+Time-Series Metrics Store
+
+Keeps the history of numeric metrics (CPU, memory, disk, per-core usage)
+in memory at several resolutions at once. Every resolution is a fixed
+size ring buffer of buckets; a bucket holds the min, max, sum and count
+of the samples that fell into it, so the 1 minute and 1 hour rollups are
+maintained as samples arrive and a query over a day reads 1440 minute
+buckets instead of 86400 raw samples.
+
+Buckets live in array.array columns (floats are single precision), so
+the default resolutions keep 30 days of a metric in about 170 KB.
+"""
+import threading
+import time
+from array import array
+
+# (seconds per bucket, buckets kept): 1 s for an hour, 1 min for two days, 1 h for 30 days
+DEFAULT_RESOLUTIONS = ((1, 3600), (60, 2 * 24 * 60), (3600, 30 * 24))
+# Percentiles reported by summary() unless others are asked for
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+class _RingBuffer:
+    """Buckets of one metric at one resolution, oldest overwritten first"""
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.starts = array('d', bytes(8 * capacity))
+        self.mins = array('f', bytes(4 * capacity))
+        self.maxs = array('f', bytes(4 * capacity))
+        self.sums = array('f', bytes(4 * capacity))
+        self.counts = array('I', bytes(4 * capacity))
+        self.head = -1
+        self.filled = 0
+
+    @property
+    def span(self):
+        return self.step * self.capacity
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column)
+                   for column in (self.starts, self.mins, self.maxs, self.sums, self.counts))
+
+    def add(self, timestamp, value):
+        start = timestamp - timestamp % self.step
+        head = self.head
+        if self.filled and start <= self.starts[head]:
+            if start < self.starts[head]:
+                return  # older than the newest bucket: already rolled up
+            if value < self.mins[head]:
+                self.mins[head] = value
+            if value > self.maxs[head]:
+                self.maxs[head] = value
+            self.sums[head] += value
+            self.counts[head] += 1
+            return
+        head = self.head = (head + 1) % self.capacity
+        self.starts[head] = start
+        self.mins[head] = self.maxs[head] = self.sums[head] = value
+        self.counts[head] = 1
+        if self.filled < self.capacity:
+            self.filled += 1
+
+    def newest_first(self, since):
+        """Indexes of the buckets overlapping [since, now], newest first"""
+        for i in range(self.filled):
+            index = (self.head - i) % self.capacity
+            if self.starts[index] + self.step <= since:
+                break
+            yield index
+
+def _percentile(ordered, q):
+    """q-th percentile of sorted values, interpolating between neighbours"""
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+class MetricsStore:
+    """Ring-buffered history of named metrics at several resolutions.
+
+    record() adds one sample of each metric; summary() and series() read a
+    window back from now using the finest resolution that still covers it.
+    Percentiles are exact at 1 s resolution (one sample per bucket when
+    sampling once a second) and taken over bucket averages at coarser ones.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS):
+        self.resolutions = tuple(sorted(resolutions))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, values, timestamp=None):
+        """Add a sample of each metric in values (name -> number)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for name, value in values.items():
+                buffers = self._series.get(name)
+                if buffers is None:
+                    buffers = self._series[name] = [_RingBuffer(step, capacity)
+                                                    for step, capacity in self.resolutions]
+                for buffer in buffers:
+                    buffer.add(timestamp, value)
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._series)
+
+    @property
+    def nbytes(self):
+        """Memory held by the ring buffers"""
+        with self._lock:
+            return sum(buffer.nbytes for buffers in self._series.values() for buffer in buffers)
+
+    def _buffer(self, metric, window, resolution):
+        buffers = self._series.get(metric)
+        if buffers is None:
+            return None
+        if resolution is not None:
+            for buffer in buffers:
+                if buffer.step == resolution:
+                    return buffer
+            raise ValueError(f"no {resolution} s resolution; kept: {[step for step, _ in self.resolutions]}")
+        for buffer in buffers:
+            if buffer.span >= window:
+                return buffer
+        return buffers[-1]
+
+    def series(self, metric, window, resolution=None, now=None):
+        """(bucket start, min, avg, max) tuples covering the last window seconds, oldest first"""
+        since = (time.time() if now is None else now) - window
+        with self._lock:
+            buffer = self._buffer(metric, window, resolution)
+            if buffer is None:
+                return []
+            points = [(buffer.starts[i], buffer.mins[i], buffer.sums[i] / buffer.counts[i], buffer.maxs[i])
+                      for i in buffer.newest_first(since)]
+        points.reverse()
+        return points
+
+    def summary(self, metric, window, percentiles=DEFAULT_PERCENTILES, resolution=None, now=None):
+        """min, avg, max and percentiles (keys 'p50', 'p95', ...) over the last window seconds.
+
+        Returns None when the metric has no samples in the window.
+        """
+        since = (time.time() if now is None else now) - window
+        with self._lock:
+            buffer = self._buffer(metric, window, resolution)
+            if buffer is None:
+                return None
+            indexes = list(buffer.newest_first(since))
+            if not indexes:
+                return None
+            total = sum(buffer.sums[i] for i in indexes)
+            samples = sum(buffer.counts[i] for i in indexes)
+            stats = {
+                'min': min(buffer.mins[i] for i in indexes),
+                'max': max(buffer.maxs[i] for i in indexes),
+                'avg': total / samples,
+                'samples': samples,
+                'resolution': buffer.step,
+            }
+            averages = sorted(buffer.sums[i] / buffer.counts[i] for i in indexes)
+        for q in percentiles:
+            stats[f'p{q:g}'] = _percentile(averages, q)
+        return stats
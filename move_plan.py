@@ -0,0 +1,472 @@
+"""
+Move Plans and the Move Engine
+"""
+import errno
+import json
+import os
+import shutil
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes handed to the kernel per copy call when moving across filesystems
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+# Cross-device copies synced to disk together before their sources are removed
+FSYNC_BATCH_SIZE = 64
+# Moves run between progress reports (or cancellation checks) when asked for
+PROGRESS_BLOCK_SIZE = 1000
+# Chain ids from here up are reserved for moves added without a group
+_SOLO_GROUP = 0x80000000
+
+def _fsync_directory(path):
+    """Flush a directory entry table to disk (no-op where unsupported)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _copy_file_data(source_fd, destination_fd):
+    """Copy a whole file between descriptors, zero-copy where the OS allows"""
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while True:
+                n = os.copy_file_range(source_fd, destination_fd, COPY_CHUNK_SIZE)
+                if n == 0:
+                    return copied
+                copied += n
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    if hasattr(os, 'sendfile') and os.name != 'nt':
+        try:
+            while True:
+                n = os.sendfile(destination_fd, source_fd, copied, COPY_CHUNK_SIZE)
+                if n == 0:
+                    return copied
+                copied += n
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    os.lseek(source_fd, copied, os.SEEK_SET)
+    os.lseek(destination_fd, copied, os.SEEK_SET)
+    while True:
+        chunk = os.read(source_fd, COPY_CHUNK_SIZE)
+        if not chunk:
+            return copied
+        os.write(destination_fd, chunk)
+        copied += len(chunk)
+
+class _CrossDeviceCopier:
+    """Move files to another filesystem as copy, fsync, then unlink.
+
+    Sources are only removed once their copies and the target folders are
+    on disk, so a crash can leave a duplicate but never lose a file. Syncing
+    every fsync_batch files instead of after each one keeps the target disk
+    from stalling on every copy.
+    """
+
+    def __init__(self, fsync_batch=FSYNC_BATCH_SIZE):
+        self.fsync_batch = fsync_batch
+        self.pending = []
+        self.errors = []
+        self.bytes_copied = 0
+
+    def copy(self, source, destination):
+        if os.path.islink(source):
+            shutil.move(source, destination)
+            return
+        try:
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                self.bytes_copied += _copy_file_data(src.fileno(), dst.fileno())
+            shutil.copystat(source, destination)
+        except OSError:
+            if os.path.exists(destination):
+                os.remove(destination)
+            raise
+        self.pending.append((source, destination))
+        if len(self.pending) >= self.fsync_batch:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        synced = []
+        directories = set()
+        for source, destination in pending:
+            try:
+                fd = os.open(destination, os.O_RDWR)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                self.errors.append((source, str(e)))
+                continue
+            synced.append(source)
+            directories.add(os.path.dirname(destination))
+        for directory in directories:
+            try:
+                _fsync_directory(directory)
+            except OSError:
+                pass
+        for source in synced:
+            try:
+                os.remove(source)
+            except OSError as e:
+                self.errors.append((source, f"copied but not removed: {e}"))
+
+def move_pairs(pairs):
+    """Move (source, destination, cross_device) triples.
+
+    Same-filesystem moves are a single rename; the rest go through a
+    _CrossDeviceCopier. Returns the failures and the number of bytes copied.
+    """
+    errors = []
+    copier = None
+    for source, destination, cross_device in pairs:
+        try:
+            if not cross_device:
+                try:
+                    os.rename(source, destination)
+                    continue
+                except OSError as e:
+                    # Bind mounts share st_dev but still refuse renames
+                    if e.errno != errno.EXDEV:
+                        raise
+            if copier is None:
+                copier = _CrossDeviceCopier()
+            copier.copy(source, destination)
+        except OSError as e:
+            errors.append((source, str(e)))
+    if copier is None:
+        return errors, 0
+    copier.flush()
+    return errors + copier.errors, copier.bytes_copied
+
+def execute_moves(pairs, executor=None, workers=1, cancel=None):
+    """Run move_pairs over a list, split into one chunk per worker.
+
+    Returns the (path, error) pairs that failed and the bytes copied.
+    cancel, a threading.Event, is checked every PROGRESS_BLOCK_SIZE moves;
+    once it is set the moves not yet started fail with "cancelled".
+    """
+    if cancel is not None:
+        errors = []
+        copied = 0
+        for start in range(0, len(pairs), PROGRESS_BLOCK_SIZE):
+            if cancel.is_set():
+                errors.extend((source, "cancelled") for source, _, _ in pairs[start:])
+                break
+            failed, block_copied = execute_moves(pairs[start:start + PROGRESS_BLOCK_SIZE], executor, workers)
+            errors.extend(failed)
+            copied += block_copied
+        return errors, copied
+
+    if executor is None or len(pairs) < 2:
+        return move_pairs(pairs)
+
+    chunk_size = -(-len(pairs) // workers)
+    futures = [executor.submit(move_pairs, pairs[i:i + chunk_size])
+               for i in range(0, len(pairs), chunk_size)]
+    errors = []
+    copied = 0
+    for future in futures:
+        failed, chunk_copied = future.result()
+        errors.extend(failed)
+        copied += chunk_copied
+    return errors, copied
+
+def execute_chains(chains, executor=None, workers=1):
+    """Run move_chains with the chains spread over the workers"""
+    if executor is None or len(chains) < 2:
+        return move_chains(chains)
+
+    futures = [executor.submit(move_chains, chains[i::workers]) for i in range(workers)]
+    errors = []
+    copied = 0
+    for future in futures:
+        failed, chunk_copied = future.result()
+        errors.extend(failed)
+        copied += chunk_copied
+    return errors, copied
+
+def move_chains(chains):
+    """Run chains of dependent moves, each strictly in order.
+
+    A step may need the name the previous step freed, so a chain stops at
+    its first failure and its remaining steps are reported as skipped.
+    Returns the failures and the number of bytes copied.
+    """
+    errors = []
+    copied = 0
+    for chain in chains:
+        for i, step in enumerate(chain):
+            failed, step_copied = move_pairs([step])
+            copied += step_copied
+            if failed:
+                errors.extend(failed)
+                errors.extend((source, "skipped: an earlier move in its chain failed")
+                              for source, _, _ in chain[i + 1:])
+                break
+    return errors, copied
+
+class MovePlan:
+    """A complete, immutable list of file moves worked out ahead of time.
+
+    Paths are not stored per move: every directory appears once in a string
+    table and each move is two array('I') indexes into it plus the source
+    and target names (the same str object when a name does not change), so
+    a million-entry plan takes tens of MB instead of a dict per file.
+
+    Moves flagged as conflicts (target already taken, or claimed by another
+    move) are kept in the plan for review but never executed.
+
+    A plan may also assign each move to a chain (groups). Moves of one
+    chain depend on each other (a rename into a name the previous step
+    freed) and run in plan order; separate chains can run concurrently.
+    """
+
+    __slots__ = ('_dirs', '_source_dirs', '_source_names', '_target_dirs', '_target_names',
+                 '_conflicts', '_create_dirs', '_groups')
+
+    def __init__(self, dirs, source_dirs, source_names, target_dirs, target_names,
+                 conflicts=(), create_dirs=(), groups=None):
+        self._dirs = tuple(dirs)
+        self._source_dirs = array('I', source_dirs)
+        self._source_names = tuple(source_names)
+        self._target_dirs = array('I', target_dirs)
+        self._target_names = tuple(target_names)
+        self._conflicts = array('I', sorted(set(conflicts)))
+        self._create_dirs = array('I', create_dirs)
+        self._groups = array('I', groups) if groups is not None else None
+
+    def __len__(self):
+        return len(self._source_names)
+
+    def __iter__(self):
+        """Yield (source, target, is_conflict) for every planned move"""
+        dirs = self._dirs
+        conflicts = set(self._conflicts)
+        join = os.path.join
+        for i, (source_dir, source_name, target_dir, target_name) in enumerate(zip(
+                self._source_dirs, self._source_names, self._target_dirs, self._target_names)):
+            yield (join(dirs[source_dir], source_name), join(dirs[target_dir], target_name),
+                   i in conflicts)
+
+    def moves(self):
+        """Yield (source, target) for the moves that will be executed"""
+        for source, target, conflict in self:
+            if not conflict:
+                yield source, target
+
+    @property
+    def conflicts(self):
+        """(source, target) pairs that will be left alone"""
+        return [(source, target) for source, target, conflict in self if conflict]
+
+    def chains(self):
+        """Return the executable moves as lists of (source, target) to run in order.
+
+        Without chain information every move is a chain of its own.
+        """
+        if self._groups is None:
+            return [[move] for move in self.moves()]
+        chains = {}
+        conflicts = set(self._conflicts)
+        for i, (source, target, _) in enumerate(self):
+            if i not in conflicts:
+                chains.setdefault(self._groups[i], []).append((source, target))
+        return list(chains.values())
+
+    @property
+    def directories_to_create(self):
+        return tuple(self._dirs[i] for i in self._create_dirs)
+
+    def summary(self):
+        return {
+            'moves': len(self) - len(self._conflicts),
+            'conflicts': len(self._conflicts),
+            'directories_to_create': len(self._create_dirs),
+        }
+
+    def execute(self, workers=1, progress=None, cancel=None):
+        """Carry out the plan; conflicting moves are skipped.
+
+        Directories are created first and each one is checked for a device
+        boundary once, so moves within a filesystem are plain renames and
+        the rest go through the fsync-batched copy pipeline. Returns a dict
+        with the files moved, the bytes copied and the failures.
+
+        progress(moves_done, moves_total) is called after every block of
+        PROGRESS_BLOCK_SIZE moves (or chains of moves) when given. cancel, a
+        threading.Event, is checked between those blocks: once it is set the
+        remaining moves are not started, they are reported as failures with
+        the error "cancelled", and 'cancelled' is True.
+        """
+        errors = []
+        for path in self.directories_to_create:
+            try:
+                os.makedirs(path, exist_ok=True)
+            except OSError as e:
+                errors.append((path, str(e)))
+
+        devices = {}
+
+        def device(dir_index):
+            if dir_index not in devices:
+                try:
+                    devices[dir_index] = os.stat(self._dirs[dir_index]).st_dev
+                except OSError:
+                    devices[dir_index] = None
+            return devices[dir_index]
+
+        conflicts = set(self._conflicts)
+        pairs = []
+        chains = {}
+        for i in range(len(self)):
+            if i in conflicts:
+                continue
+            source_dir, target_dir = self._source_dirs[i], self._target_dirs[i]
+            pair = (os.path.join(self._dirs[source_dir], self._source_names[i]),
+                    os.path.join(self._dirs[target_dir], self._target_names[i]),
+                    device(source_dir) != device(target_dir))
+            if self._groups is None:
+                pairs.append(pair)
+            else:
+                chains.setdefault(self._groups[i], []).append(pair)
+
+        if self._groups is None:
+            units, run = pairs, execute_moves
+        else:
+            units, run = list(chains.values()), execute_chains
+        total = len(pairs) if self._groups is None else sum(len(chain) for chain in units)
+        # Without progress or cancellation to check, everything runs as one block
+        if progress is None and cancel is None:
+            step = max(len(units), 1)
+        else:
+            step = PROGRESS_BLOCK_SIZE
+
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        failed = []
+        copied = 0
+        done = 0
+        cancelled = False
+        try:
+            for start in range(0, len(units), step):
+                if cancel is not None and cancel.is_set():
+                    cancelled = True
+                    for unit in units[start:]:
+                        steps = [unit] if run is execute_moves else unit
+                        failed.extend((source, "cancelled") for source, _, _ in steps)
+                    break
+                block = units[start:start + step]
+                block_failed, block_copied = run(block, executor, workers)
+                failed.extend(block_failed)
+                copied += block_copied
+                done += len(block) if run is execute_moves else sum(len(chain) for chain in block)
+                if progress is not None:
+                    progress(done, total)
+        finally:
+            if executor:
+                executor.shutdown()
+        errors.extend(failed)
+        return {'moved': total - len(failed), 'bytes_copied': copied, 'errors': errors,
+                'cancelled': cancelled}
+
+    def to_dict(self):
+        # Unchanged target names are stored as null to keep the file small
+        return {
+            'dirs': list(self._dirs),
+            'source_dirs': self._source_dirs.tolist(),
+            'source_names': list(self._source_names),
+            'target_dirs': self._target_dirs.tolist(),
+            'target_names': [None if target == source else target
+                             for source, target in zip(self._source_names, self._target_names)],
+            'conflicts': self._conflicts.tolist(),
+            'create_dirs': self._create_dirs.tolist(),
+            'groups': self._groups.tolist() if self._groups is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        source_names = data['source_names']
+        target_names = [source if target is None else target
+                        for source, target in zip(source_names, data['target_names'])]
+        return cls(data['dirs'], data['source_dirs'], source_names, data['target_dirs'],
+                   target_names, data['conflicts'], data['create_dirs'], data.get('groups'))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    def diff(self, other):
+        """Compare with another plan, matching moves by source path.
+
+        Returns a dict of 'added' and 'removed' (source, target) pairs and
+        'changed' (source, old target, new target) triples.
+        """
+        mine = {source: target for source, target, _ in self}
+        added = []
+        changed = []
+        for source, target, _ in other:
+            previous = mine.pop(source, None)
+            if previous is None:
+                added.append((source, target))
+            elif previous != target:
+                changed.append((source, previous, target))
+        return {'added': added, 'removed': list(mine.items()), 'changed': changed}
+
+class PlanBuilder:
+    """Accumulates moves and interns directories for a MovePlan"""
+
+    def __init__(self):
+        self._dir_index = {}
+        self._source_dirs = array('I')
+        self._source_names = []
+        self._target_dirs = array('I')
+        self._target_names = []
+        self._conflicts = array('I')
+        self._create_dirs = array('I')
+        self._groups = None
+
+    def _intern(self, path):
+        index = self._dir_index.get(path)
+        if index is None:
+            index = self._dir_index[path] = len(self._dir_index)
+        return index
+
+    def add(self, source_dir, source_name, target_dir, target_name=None, conflict=False,
+            group=None):
+        """Plan one move; target_name defaults to the source name.
+
+        Moves given the same group form a chain executed in the order added;
+        a move without a group is a chain of its own.
+        """
+        if group is not None and self._groups is None:
+            self._groups = array('I', (_SOLO_GROUP + i for i in range(len(self._source_names))))
+        if self._groups is not None:
+            self._groups.append(group if group is not None else _SOLO_GROUP + len(self._source_names))
+        if conflict:
+            self._conflicts.append(len(self._source_names))
+        self._source_dirs.append(self._intern(source_dir))
+        self._source_names.append(source_name)
+        self._target_dirs.append(self._intern(target_dir))
+        self._target_names.append(source_name if target_name is None else target_name)
+
+    def create_dir(self, path):
+        self._create_dirs.append(self._intern(path))
+
+    def __len__(self):
+        return len(self._source_names)
+
+    def build(self):
+        return MovePlan(self._dir_index, self._source_dirs, self._source_names,
+                        self._target_dirs, self._target_names, self._conflicts, self._create_dirs,
+                        self._groups)
@@ -0,0 +1,187 @@
+"""
+Rename Templates
+
+A template describes a file's new name with fields in braces:
+
+    {n}            counter; zero-padded to the width of the largest number
+                   (at least 3 digits), {n:5} forces a width
+    {name}         the original name without its extension
+    {ext}          the original extension, including the dot
+    {file}         the whole original name
+    {1}, {label}   a group captured by the template's regex pattern
+    {date}         the file's modification date, {date:%Y-%m-%d_%H%M} for
+                   any strftime format (default %Y%m%d)
+
+Any field takes case transforms after a bar: {name|lower}, {1|upper|title}.
+Use {{ and }} for literal braces.
+
+A template names a file, not a path: batch_rename skips files whose new
+name contains a path separator (from the template, a capture or a date
+format such as %Y/%m) or is empty, '.' or '..'.
+
+Each template is compiled once into a generated Python function that
+renames a whole list of names in one loop, with every field inlined.
+"""
+import re
+import time
+
+# Smallest counter width, so short batches keep the familiar 001, 002, ...
+MIN_COUNTER_WIDTH = 3
+# strftime format used by a bare {date}
+DEFAULT_DATE_FORMAT = '%Y%m%d'
+# Case transforms allowed after | in a field
+CASE_TRANSFORMS = ('lower', 'upper', 'title', 'capitalize', 'swapcase')
+
+# strftime directives that never change within a 15 minute span of UTC time
+# (time zone offsets are multiples of 15 minutes), so dates that only use
+# these can be formatted once per span instead of once per file
+_COARSE_DATE_DIRECTIVES = set('aAbBdDeFgGhHIjklmpuUVwWxyYzZC%')
+# Seconds of modification time sharing one formatted date
+_COARSE_DATE_SPAN = 900
+
+_FIELD = re.compile(r'\{\{|\}\}|\{([^{}|:]*)(?::([^{}|]*))?((?:\|[a-z]+)*)\}|[{}]')
+
+def escape(text):
+    """Make literal text safe to use inside a template"""
+    return text.replace('{', '{{').replace('}', '}}')
+
+def _date_span(date_format):
+    """Seconds of modification time that always format to the same text"""
+    directives = set(re.findall(r'%[-#_0^]*(.)', date_format))
+    return _COARSE_DATE_SPAN if directives <= _COARSE_DATE_DIRECTIVES else 1
+
+class RenameTemplate:
+    """A compiled rename template, optionally with a regex for capture groups.
+
+    Files whose name does not match the pattern are left out of apply().
+    Raises ValueError for a malformed template or unknown field.
+    """
+
+    def __init__(self, template, pattern=None):
+        self.template = template
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self._dates = []
+        self._apply = self._compile(template)
+
+    @property
+    def uses_mtime(self):
+        return bool(self._dates)
+
+    def _field(self, name, spec):
+        if name == 'n':
+            if spec:
+                if not spec.isdigit():
+                    raise ValueError(f"counter width must be a number: {{n:{spec}}}")
+                return f"str(n).zfill({int(spec)})"
+            return "str(n).zfill(width)"
+        if spec:
+            if name != 'date':
+                raise ValueError(f"only {{n}} and {{date}} take a format: {{{name}:{spec}}}")
+        if name == 'name':
+            return "stem"
+        if name == 'ext':
+            return "ext"
+        if name == 'file':
+            return "filename"
+        if name == 'date':
+            self._dates.append(spec or DEFAULT_DATE_FORMAT)
+            return f"date{len(self._dates) - 1}"
+        if self.pattern is None:
+            raise ValueError(f"{{{name}}} needs a regex pattern to capture from")
+        if name.isdigit():
+            group = int(name)
+            if group > self.pattern.groups:
+                raise ValueError(f"pattern has no group {group}")
+        elif name in self.pattern.groupindex:
+            group = name
+        else:
+            raise ValueError(f"unknown template field: {{{name}}}")
+        return f"(match[{group!r}] or '')"
+
+    def _compile(self, template):
+        """Turn the template into one function renaming a whole list of files.
+
+        The loop is generated as Python source with every field inlined,
+        so only the work the template needs happens per file: no
+        extension split unless {name} or {ext} is used, no date
+        formatting unless {date} is, and each distinct date formatted once.
+        """
+        parts = []
+        position = 0
+        for field in _FIELD.finditer(template):
+            if field.start() > position:
+                parts.append(repr(template[position:field.start()]))
+            position = field.end()
+            token = field.group()
+            if token in ('{{', '}}'):
+                parts.append(repr(token[0]))
+                continue
+            if token in ('{', '}'):
+                raise ValueError(f"unmatched brace at position {field.start()} in {template!r}")
+            expression = self._field(field.group(1).strip(), field.group(2))
+            for transform in filter(None, field.group(3).split('|')):
+                if transform not in CASE_TRANSFORMS:
+                    raise ValueError(f"unknown case transform: |{transform}")
+                expression = f"{expression}.{transform}()"
+            parts.append(expression)
+        if position < len(template):
+            parts.append(repr(template[position:]))
+        expression = " + ".join(parts) or "''"
+
+        if self.pattern is not None:
+            lines = ["    for n, (filename, match) in enumerate(files, start):"]
+        else:
+            lines = ["    for n, filename in enumerate(files, start):"]
+        if re.search(r'\b(stem|ext)\b', expression):
+            # os.path.splitext without the call: leading dots are not an extension
+            lines += ["        stem, dot, ext = filename.rpartition('.')",
+                      "        if stem.lstrip('.'):",
+                      "            ext = dot + ext",
+                      "        else:",
+                      "            stem, ext = filename, ''"]
+        if self._dates:
+            lines.append("        mtime = mtimes[filename]")
+        for i, date_format in enumerate(self._dates):
+            lines += [f"        key = mtime // {_date_span(date_format)}",
+                      f"        date{i} = cache{i}.get(key)",
+                      f"        if date{i} is None:",
+                      f"            date{i} = cache{i}[key] = strftime({date_format!r}, localtime(mtime))"]
+        lines.append(f"        renames[filename] = {expression}")
+        source = "\n".join(
+            ["def apply(files, mtimes, start, width):", "    renames = {}"]
+            + [f"    cache{i} = {{}}" for i in range(len(self._dates))]
+            + lines + ["    return renames"])
+        namespace = {'strftime': time.strftime, 'localtime': time.localtime}
+        exec(source, namespace)
+        return namespace['apply']
+
+    def render(self, filename, n=1, width=MIN_COUNTER_WIDTH, mtime=None):
+        """New name for one file, or None when the pattern does not match it"""
+        files = [filename]
+        if self.pattern is not None:
+            match = self.pattern.search(filename)
+            if match is None:
+                return None
+            files = [(filename, match)]
+        return self._apply(files, {filename: mtime}, n, width)[filename]
+
+    def apply(self, filenames, mtimes=None, start=1):
+        """Map each matching filename to its new name, numbering from start.
+
+        mtimes maps filenames to modification times and is required when
+        the template uses {date}. The counter width fits the last number.
+        """
+        if self.uses_mtime and mtimes is None:
+            raise ValueError("this template uses {date}: modification times are needed")
+        if self.pattern is not None:
+            search = self.pattern.search
+            files = [(filename, match) for filename in filenames
+                     for match in (search(filename),) if match is not None]
+        else:
+            files = filenames if isinstance(filenames, (list, tuple)) else list(filenames)
+        width = max(MIN_COUNTER_WIDTH, len(str(start + len(files) - 1)))
+        return self._apply(files, mtimes, start, width)
+
+def prefix_template(prefix, pattern=None):
+    """The template batch renames have always used: prefix_001.ext"""
+    return RenameTemplate(escape(prefix) + '_{n}{ext}', pattern)
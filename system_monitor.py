@@ -1,19 +1,399 @@
 """
 System Monitoring
+
+A SystemSampler thread measures CPU, memory and disk usage in the
+background at a fixed rate and keeps the latest snapshot in memory, so
+the CLI and GUI read current figures instantly instead of blocking a
+second in psutil.cpu_percent(interval=1) on every refresh. Every sample
+is also added to the sampler's MetricsStore, which keeps days of history
+for window queries, and its ProcessProfiler keeps the process table for
+top-N views. Every mount is checked on its own thread, so a hung network
+share is reported as not responding instead of stalling the sample.
 """
+import heapq
 import os
+import threading
+import time
+from concurrent.futures import Future, wait
 import psutil
 
-def show_system_stats():
-    try:
-        cpu_percent = psutil.cpu_percent(interval=1)
+import events
+from events import emit
+from metrics_store import MetricsStore
+
+# Seconds between samples taken by the background sampler
+DEFAULT_SAMPLE_INTERVAL = 1.0
+# Seconds between process table scans; a scan costs far more than a system sample
+DEFAULT_PROCESS_INTERVAL = 2.0
+# Seconds the first sample waits for, so a fresh sampler has CPU figures quickly
+FIRST_SAMPLE_DELAY = 0.25
+# Disk whose usage is reported as disk_percent / disk_free
+SYSTEM_DISK = 'C:\\' if os.name == 'nt' else '/'
+# Seconds a sample waits for mounts' usage before reporting them as not responding
+MOUNT_TIMEOUT = 1.0
+# Network file systems, which disk_partitions() leaves out unless asked for all mounts
+NETWORK_FSTYPES = frozenset(['nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', '9p', 'ceph',
+                             'fuse.sshfs', 'fuse.glusterfs', 'afpfs', 'webdav'])
+# Snapshot values kept in the history, besides per-core usage
+HISTORY_METRICS = ('cpu_percent', 'memory_percent', 'disk_percent', 'memory_available', 'disk_free',
+                   'disk_read_rate', 'disk_write_rate', 'net_sent_rate', 'net_recv_rate')
+# Windows summarised by format_history: (seconds, description)
+HISTORY_WINDOWS = ((60, 'minute'), (3600, 'hour'), (24 * 3600, 'day'))
+# Only these are read per process, so a scan costs one /proc read or so each
+PROCESS_ATTRS = ['pid', 'name', 'create_time', 'cpu_times', 'memory_info']
+# Processes shown by default in a top-N view
+DEFAULT_TOP_PROCESSES = 10
+# Columns a top-N view can rank by
+PROCESS_SORT_KEYS = ('cpu_percent', 'memory_rss')
+
+def mounted_filesystems():
+    """Local disks plus network shares, one entry per mount point"""
+    partitions = {}
+    for partition in psutil.disk_partitions():
+        partitions.setdefault(partition.mountpoint, partition)
+    for partition in psutil.disk_partitions(all=True):
+        if partition.fstype in NETWORK_FSTYPES:
+            partitions.setdefault(partition.mountpoint, partition)
+    return list(partitions.values())
+
+def _disk_usage_async(mountpoint):
+    """psutil.disk_usage on a daemon thread, so a hung mount never blocks exit"""
+    future = Future()
+    def run():
+        try:
+            future.set_result(psutil.disk_usage(mountpoint))
+        except Exception as e:
+            future.set_exception(e)
+    threading.Thread(target=run, name='disk-usage', daemon=True).start()
+    return future
+
+class MountPoller:
+    """Usage of every mount, checked concurrently with a shared timeout.
+
+    A mount that has not answered within the timeout is reported with an
+    error and is not asked again until its pending call returns, so a hung
+    share ties up one thread rather than one more every sample, and later
+    polls do not wait for it again.
+    """
+
+    def __init__(self, timeout=MOUNT_TIMEOUT):
+        self.timeout = timeout
+        self._pending = {}
+
+    def poll(self, partitions):
+        calls = {}
+        started = []
+        for partition in partitions:
+            future = self._pending.get(partition.mountpoint)
+            if future is None or future.done():
+                future = _disk_usage_async(partition.mountpoint)
+                started.append(future)
+            calls[partition.mountpoint] = (partition, future)
+        wait(started, timeout=self.timeout)
+        self._pending = {}
+        mounts = []
+        for mountpoint, (partition, future) in calls.items():
+            mount = {'mountpoint': mountpoint, 'device': partition.device, 'fstype': partition.fstype}
+            if not future.done():
+                self._pending[mountpoint] = future
+                mount['error'] = "not responding"
+            elif future.exception() is not None:
+                mount['error'] = str(future.exception())
+            else:
+                usage = future.result()
+                mount.update(total=usage.total, used=usage.used, free=usage.free, percent=usage.percent)
+            mounts.append(mount)
+        return mounts
+
+def _rates(previous, current, elapsed, fields):
+    """Per-second change of each device's counters, for devices that have ever been used"""
+    rates = {}
+    for name, counters in current.items():
+        if not any(getattr(counters, field) for field, _ in fields):
+            continue  # an unused loop device or virtual interface
+        last = previous.get(name)
+        rates[name] = {rate: max(getattr(counters, field) - getattr(last, field), 0) / elapsed
+                       if last is not None else 0.0
+                       for field, rate in fields}
+    return rates
+
+class ProcessProfiler:
+    """Per-process CPU and memory usage from repeated process table scans.
+
+    Each sample() walks psutil.process_iter with only PROCESS_ATTRS and
+    turns the CPU time used since the previous sample into a percentage
+    (100% is one full core). psutil reuses its Process handles between
+    scans; the profiler keeps each pid's previous CPU time, keyed with its
+    create time so a recycled pid starts afresh. A process seen for the
+    first time reports 0% until the next sample.
+    """
+
+    def __init__(self):
+        self._cpu_times = {}
+        self._timestamp = None
+        self._rows = []
+        self._samples = 0
+
+    @property
+    def ready(self):
+        """True once CPU usage is known, which takes two samples"""
+        return self._samples >= 2
+
+    def sample(self):
+        """Scan the process table; returns one dict per process"""
+        now = time.monotonic()
+        elapsed = now - self._timestamp if self._timestamp is not None else None
+        total_memory = psutil.virtual_memory().total
+        previous = self._cpu_times
+        cpu_times = {}
+        rows = []
+        for process in psutil.process_iter(PROCESS_ATTRS):
+            info = process.info
+            times, memory = info['cpu_times'], info['memory_info']
+            cpu_percent = 0.0
+            if times is not None:
+                key = (info['pid'], info['create_time'])
+                used = times.user + times.system
+                cpu_times[key] = used
+                last = previous.get(key)
+                if last is not None and elapsed:
+                    cpu_percent = max(used - last, 0.0) / elapsed * 100
+            rss = memory.rss if memory is not None else 0
+            rows.append({
+                'pid': info['pid'],
+                'name': info['name'] or '?',
+                'cpu_percent': cpu_percent,
+                'memory_rss': rss,
+                'memory_percent': rss / total_memory * 100,
+            })
+        self._cpu_times = cpu_times
+        self._timestamp = now
+        self._rows = rows
+        self._samples += 1
+        return rows
+
+    def top(self, n=DEFAULT_TOP_PROCESSES, by='cpu_percent'):
+        """The n processes using the most of by (see PROCESS_SORT_KEYS) in the last sample"""
+        if by not in PROCESS_SORT_KEYS:
+            raise ValueError(f"cannot rank processes by {by!r}; choose from {PROCESS_SORT_KEYS}")
+        return heapq.nlargest(n, self._rows, key=lambda row: row[by])
+
+class SystemSampler:
+    """Samples system usage on a daemon thread.
+
+    CPU usage comes from psutil.cpu_percent(None), the busy share since the
+    previous sample, so taking a sample never blocks. latest() returns the
+    most recent snapshot, a dict that is replaced, never modified, so
+    readers on any thread can use it without locking. history holds every
+    sample, per-core usage as cpu_core_0, cpu_core_1, ... Callbacks given
+    to add_listener() receive each snapshot on the sampler thread.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, history=None,
+                 process_interval=DEFAULT_PROCESS_INTERVAL):
+        self.interval = interval
+        self.process_interval = process_interval
+        self.history = MetricsStore() if history is None else history
+        self.processes = ProcessProfiler()
+        self.mounts = MountPoller()
+        self._io_counters = None
+        self._system_disk = {'percent': None, 'free': None}
+        self._listeners = []
+        self._latest = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='system-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def add_listener(self, callback):
+        """Call callback(snapshot) after every sample"""
+        self._listeners.append(callback)
+
+    def stop(self, wait=False):
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        psutil.cpu_percent(None)
+        psutil.cpu_percent(None, percpu=True)
+        self._io_rates()
+        self.processes.sample()
+        last_scan = time.monotonic()
+        delay = min(FIRST_SAMPLE_DELAY, self.interval)
+        while not self._stop.wait(delay):
+            try:
+                stats = self.sample()
+                self._record(stats)
+                if time.monotonic() - last_scan >= self.process_interval or not self.processes.ready:
+                    self.processes.sample()
+                    last_scan = time.monotonic()
+                self._latest = stats
+                self._ready.set()
+                for listener in self._listeners:
+                    listener(stats)
+            except Exception as e:
+                emit(f"Error getting system stats: {e}", kind='error')
+            delay = self.interval
+
+    def _io_rates(self):
+        """Per-disk and per-interface byte rates since the previous call"""
+        now = time.monotonic()
+        disks = psutil.disk_io_counters(perdisk=True) or {}
+        nics = psutil.net_io_counters(pernic=True) or {}
+        previous_time, previous_disks, previous_nics = self._io_counters or (now, {}, {})
+        self._io_counters = (now, disks, nics)
+        elapsed = now - previous_time
+        if elapsed <= 0:
+            return {}, {}
+        return (_rates(previous_disks, disks, elapsed,
+                       (('read_bytes', 'read_rate'), ('write_bytes', 'write_rate'))),
+                _rates(previous_nics, nics, elapsed,
+                       (('bytes_sent', 'sent_rate'), ('bytes_recv', 'recv_rate'))))
+
+    def sample(self):
+        """Take one snapshot now; CPU usage and I/O rates cover the time since the last one"""
         memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('C:' if os.name == 'nt' else '/')
-        
-        print(f"CPU Usage: {cpu_percent}%")
-        print(f"Memory Usage: {memory.percent}%")
-        print(f"Disk Usage: {disk.percent}%")
-        print(f"Available Memory: {memory.available / (1024**3):.2f} GB")
-        print(f"Available Disk Space: {disk.free / (1024**3):.2f} GB")
+        mounts = tuple(self.mounts.poll(mounted_filesystems()))
+        disk = next((mount for mount in mounts if mount['mountpoint'] == SYSTEM_DISK), None)
+        if disk is None:
+            # Not among the partitions psutil lists, so the poller never asks it
+            usage = psutil.disk_usage(SYSTEM_DISK)
+            disk = {'percent': usage.percent, 'free': usage.free}
+        elif 'error' in disk:
+            # Not responding: keep the last figures (None until there are any)
+            disk = self._system_disk
+        self._system_disk = disk
+        disk_io, net_io = self._io_rates()
+        return {
+            'timestamp': time.time(),
+            'cpu_percent': psutil.cpu_percent(None),
+            'cpu_per_core': tuple(psutil.cpu_percent(None, percpu=True)),
+            'memory_percent': memory.percent,
+            'disk_percent': disk['percent'],
+            'memory_available': memory.available,
+            'disk_free': disk['free'],
+            'mounts': mounts,
+            'disk_io': disk_io,
+            'net_io': net_io,
+            'disk_read_rate': sum(rates['read_rate'] for rates in disk_io.values()),
+            'disk_write_rate': sum(rates['write_rate'] for rates in disk_io.values()),
+            'net_sent_rate': sum(rates['sent_rate'] for rates in net_io.values()),
+            'net_recv_rate': sum(rates['recv_rate'] for rates in net_io.values()),
+        }
+
+    def _record(self, stats):
+        values = {name: stats[name] for name in HISTORY_METRICS if stats[name] is not None}
+        for core, percent in enumerate(stats['cpu_per_core']):
+            values[f'cpu_core_{core}'] = percent
+        self.history.record(values, stats['timestamp'])
+
+    def latest(self, timeout=None):
+        """The newest snapshot, waiting up to timeout seconds for the first one.
+
+        Returns None if no snapshot was taken in time; timeout=0 never waits.
+        """
+        if self._latest is None and timeout != 0:
+            self._ready.wait(timeout)
+        return self._latest
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def sampler(interval=DEFAULT_SAMPLE_INTERVAL):
+    """The process-wide sampler, started on first use"""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = SystemSampler(interval)
+        return _sampler.start()
+
+def format_stats(stats):
+    """The lines show_system_stats prints for a snapshot"""
+    lines = [
+        f"CPU Usage: {stats['cpu_percent']}%",
+        f"Memory Usage: {stats['memory_percent']}%",
+        f"Disk Usage: {stats['disk_percent']}%" if stats['disk_percent'] is not None
+        else "Disk Usage: not responding",
+        f"Available Memory: {stats['memory_available'] / (1024**3):.2f} GB",
+        f"Available Disk Space: {stats['disk_free'] / (1024**3):.2f} GB" if stats['disk_free'] is not None
+        else "Available Disk Space: not responding",
+        "Per-core CPU: " + " ".join(f"{percent}%" for percent in stats['cpu_per_core']),
+    ]
+    for mount in stats['mounts']:
+        if 'error' in mount:
+            lines.append(f"💽 {mount['mountpoint']} ({mount['fstype']}): {mount['error']}")
+        else:
+            lines.append(f"💽 {mount['mountpoint']} ({mount['fstype']}): {mount['percent']}% used, "
+                         f"{mount['free'] / (1024**3):.2f} GB free")
+    for disk, rates in stats['disk_io'].items():
+        lines.append(f"Disk I/O {disk}: read {rates['read_rate'] / 1024**2:.2f} MB/s, "
+                     f"write {rates['write_rate'] / 1024**2:.2f} MB/s")
+    for nic, rates in stats['net_io'].items():
+        lines.append(f"Network {nic}: sent {rates['sent_rate'] / 1024:.1f} KB/s, "
+                     f"received {rates['recv_rate'] / 1024:.1f} KB/s")
+    return lines
+
+def format_history(history):
+    """min/avg/max/p95 lines for each of HISTORY_WINDOWS the history reaches back into"""
+    lines = []
+    for metric, label in (('cpu_percent', 'CPU'), ('memory_percent', 'Memory'), ('disk_percent', 'Disk')):
+        samples = 0
+        for window, description in HISTORY_WINDOWS:
+            summary = history.summary(metric, window, percentiles=(95,))
+            if summary is None or summary['samples'] == samples:
+                break  # no older samples: a longer window would repeat the last line
+            samples = summary['samples']
+            lines.append(f"{label} over the last {description}: min {summary['min']:.1f}% / "
+                         f"avg {summary['avg']:.1f}% / max {summary['max']:.1f}% / p95 {summary['p95']:.1f}%")
+    return lines
+
+def format_processes(rows):
+    """A table of processes as lines, as show_top_processes prints it"""
+    lines = [f"{'PID':>7}  {'CPU':>6}  {'Memory':>9}  Name"]
+    for row in rows:
+        lines.append(f"{row['pid']:>7}  {row['cpu_percent']:>5.1f}%  "
+                     f"{row['memory_rss'] / (1024**2):>6.0f} MB  {row['name']}")
+    return lines
+
+def show_top_processes(n=DEFAULT_TOP_PROCESSES, by='cpu_percent', timeout=5):
+    """Report the processes using the most CPU (or memory); returns their rows"""
+    try:
+        monitor = sampler()
+        if monitor.latest(timeout) is None:
+            emit("Error getting process stats: no sample yet", kind='error')
+            return None
+        rows = monitor.processes.top(n, by)
+        for line in format_processes(rows):
+            emit(line)
+        events.result(processes=rows)
+        return rows
+    except Exception as e:
+        emit(f"Error getting process stats: {e}", kind='error')
+
+def show_system_stats(timeout=5):
+    """Report CPU, memory and disk usage from the sampler; returns the figures as a dict"""
+    try:
+        stats = sampler().latest(timeout)
+        if stats is None:
+            emit("Error getting system stats: no sample yet", kind='error')
+            return None
+        for line in format_stats(stats) + format_history(sampler().history):
+            emit(line)
+        events.result(**stats)
+        return stats
     except Exception as e:
-        print(f"Error getting system stats: {e}")
+        emit(f"Error getting system stats: {e}", kind='error')
@@ -0,0 +1,145 @@
+"""
+Background Task Manager
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import events
+
+# Jobs allowed to run at once; the rest wait in the queue
+DEFAULT_TASK_WORKERS = 2
+# Finished tasks remembered for display before the oldest are forgotten
+MAX_FINISHED_TASKS = 20
+
+class Task:
+    """One job submitted to a TaskManager.
+
+    state goes queued -> running -> done / failed / cancelled. cancel_event
+    is the task's cancellation token: the work function receives it and the
+    organizer and renamer check it between files. progress holds the data
+    of the latest progress event the task emitted to its listener.
+    """
+
+    def __init__(self, task_id, name):
+        self.id = task_id
+        self.name = name
+        self.state = 'queued'
+        self.cancel_event = threading.Event()
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self.progress = None
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def cancel(self):
+        """Ask the task to stop; a task still in the queue never starts"""
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+class TaskManager:
+    """Runs jobs on a bounded thread pool with cancellation and callbacks.
+
+    submit(name, work) queues work(cancel_event); at most max_workers jobs
+    run at once. Each job's events go to its listener (see events.listen),
+    on_done(task) is called when it finishes, and the manager's on_change
+    callback fires whenever any task changes state. Callbacks run on the
+    worker thread; a GUI hands them over to its own thread.
+    """
+
+    def __init__(self, max_workers=DEFAULT_TASK_WORKERS, on_change=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task')
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._tasks = []
+        self.on_change = on_change
+
+    def submit(self, name, work, on_done=None, listener=None):
+        task = Task(next(self._ids), name)
+        with self._lock:
+            self._tasks.append(task)
+            self._forget_finished()
+        task.future = self._executor.submit(self._run, task, work, on_done, listener)
+        task.future.add_done_callback(lambda future: self._cancelled_in_queue(task, future, on_done))
+        self._changed(task)
+        return task
+
+    def _run(self, task, work, on_done, listener):
+        if task.cancel_event.is_set():
+            return
+        task.state = 'running'
+        task.started = time.time()
+        self._changed(task)
+        try:
+            if listener is not None:
+                with events.listen(lambda event: self._forward(task, listener, event)):
+                    task.result = work(task.cancel_event)
+            else:
+                task.result = work(task.cancel_event)
+            task.state = 'cancelled' if task.cancel_event.is_set() else 'done'
+        except Exception as e:
+            task.error = e
+            task.state = 'failed'
+        task.finished = time.time()
+        self._changed(task)
+        if on_done is not None:
+            on_done(task)
+
+    @staticmethod
+    def _forward(task, listener, event):
+        if event.kind == 'progress':
+            task.progress = event.data
+        listener(event)
+
+    def _cancelled_in_queue(self, task, future, on_done):
+        if not future.cancelled() and task.state != 'queued':
+            return
+        task.state = 'cancelled'
+        task.finished = time.time()
+        self._changed(task)
+        if on_done is not None:
+            on_done(task)
+
+    def _changed(self, task):
+        if self.on_change is not None:
+            self.on_change(task)
+
+    def _forget_finished(self):
+        finished = [task for task in self._tasks if not task.active]
+        for task in finished[:-MAX_FINISHED_TASKS]:
+            self._tasks.remove(task)
+
+    def tasks(self):
+        """Every known task, oldest first"""
+        with self._lock:
+            return list(self._tasks)
+
+    def cancel(self, task_id):
+        for task in self.tasks():
+            if task.id == task_id:
+                task.cancel()
+                return True
+        return False
+
+    def cancel_all(self):
+        for task in self.tasks():
+            if task.active:
+                task.cancel()
+
+    def shutdown(self, wait=False):
+        self.cancel_all()
+        self._executor.shutdown(wait=wait, cancel_futures=True)